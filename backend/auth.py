@@ -6,6 +6,7 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from models import User, UserResponse
 from database import get_users_collection
+from cache import user_cache
 from bson import ObjectId
 import os
 
@@ -57,13 +58,16 @@ async def get_user(email: str) -> Optional[User]:
 
 async def get_user_by_id(user_id: str) -> Optional[User]:
     """Get user by ID"""
-    users = await get_users_collection()
-    user_data = await users.find_one({"_id": ObjectId(user_id)})
-    if user_data:
+    user_data = user_cache.get(user_id)
+    if user_data is None:
+        users = await get_users_collection()
+        user_data = await users.find_one({"_id": ObjectId(user_id)})
+        if not user_data:
+            return None
         user_data["id"] = str(user_data["_id"])
         del user_data["_id"]
-        return User(**user_data)
-    return None
+        user_cache.set(user_id, user_data)
+    return User(**user_data)
 
 async def authenticate_user(email: str, password: str) -> Optional[User]:
     """Authenticate user with email and password"""
@@ -74,6 +78,15 @@ async def authenticate_user(email: str, password: str) -> Optional[User]:
         return None
     return user
 
+def token_subject(token: str) -> Optional[str]:
+    """User id of a valid, unexpired access token (None otherwise); no database read"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    subject = payload.get("sub")
+    return str(subject) if subject else None
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserResponse:
     """Get current user from JWT token"""
     credentials_exception = HTTPException(
@@ -0,0 +1,159 @@
+"""In-process caches with TTL and size-bounded LRU eviction"""
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional
+import bson
+
+class CatalogCache:
+    """LRU cache bounded by entry count and approximate byte size.
+
+    Entries expire after ``ttl_seconds`` and can carry tags so a write can
+    drop every entry depending on, e.g., one category without a full clear.
+    """
+
+    def __init__(self, name: str, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._tags: dict = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value or None on a miss/expired entry"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at, size, tags = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str] = ()):
+        """Store a value, evicting least recently used entries to stay in bounds"""
+        size = len(bson.encode({"v": value}))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+
+        tags = tuple(tags)
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds, size, tags)
+        self._bytes += size
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def delete(self, key: Hashable):
+        """Drop a single entry"""
+        if key in self._entries:
+            self._remove(key)
+            self.invalidations += 1
+
+    def invalidate_tag(self, tag: str):
+        """Drop every entry stored with ``tag``"""
+        for key in list(self._tags.get(tag, ())):
+            self.delete(key)
+
+    def clear(self):
+        """Drop every entry"""
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tags.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        """Counters and current footprint"""
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "maxEntries": self.max_entries,
+            "maxBytes": self.max_bytes,
+            "ttlSeconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+    def _remove(self, key: Hashable):
+        value, expires_at, size, tags = self._entries.pop(key)
+        self._bytes -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+CACHE_TTL_SECONDS = float(os.environ.get("CATALOG_CACHE_TTL_SECONDS", 300))
+
+# Single product documents, keyed by product id
+product_cache = CatalogCache(
+    "products",
+    max_entries=int(os.environ.get("PRODUCT_CACHE_MAX_ENTRIES", 5000)),
+    max_bytes=int(os.environ.get("PRODUCT_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    ttl_seconds=CACHE_TTL_SECONDS
+)
+
+# Product list pages, keyed by the normalized query parameters and tagged by category
+product_list_cache = CatalogCache(
+    "product_lists",
+    max_entries=int(os.environ.get("PRODUCT_LIST_CACHE_MAX_ENTRIES", 1000)),
+    max_bytes=int(os.environ.get("PRODUCT_LIST_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    ttl_seconds=CACHE_TTL_SECONDS
+)
+
+# Category registry listing (a single entry, refreshed on product writes)
+category_cache = CatalogCache(
+    "categories",
+    max_entries=1,
+    max_bytes=1024 * 1024,
+    ttl_seconds=CACHE_TTL_SECONDS
+)
+
+# Authenticated user documents, keyed by user id; short TTL as a safety net
+# for role/deactivation changes when the cache bus is not running
+user_cache = CatalogCache(
+    "users",
+    max_entries=int(os.environ.get("USER_CACHE_MAX_ENTRIES", 10000)),
+    max_bytes=int(os.environ.get("USER_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+    ttl_seconds=float(os.environ.get("USER_CACHE_TTL_SECONDS", 60))
+)
+
+ALL_CATEGORIES_TAG = "category:*"
+
+def category_tag(category: Optional[str]) -> str:
+    """Tag for list entries filtered on ``category`` (or unfiltered)"""
+    return f"category:{category}" if category else ALL_CATEGORIES_TAG
+
+def invalidate_product(product_id: Optional[str], *categories: Optional[str]):
+    """Drop a product and every list page that may contain it"""
+    if product_id:
+        product_cache.delete(product_id)
+    product_list_cache.invalidate_tag(ALL_CATEGORIES_TAG)
+    for category in set(categories):
+        if category:
+            product_list_cache.invalidate_tag(category_tag(category))
+
+def cache_stats() -> list:
+    """Counters for every in-process cache"""
+    return [product_cache.stats(), product_list_cache.stats(), category_cache.stats(), user_cache.stats()]
@@ -0,0 +1,133 @@
+"""Cross-worker cache invalidation driven by MongoDB change streams
+
+Every worker tails the ``products`` and ``users`` change streams and drops
+the matching entries from its own in-process caches, so an admin write
+handled by one worker is seen by all of them. Resume tokens are persisted
+per node, so a restarted worker replays the events it missed.
+
+Change streams need a replica set. For local testing a single node is
+enough: ``mongod --replSet rs0`` followed by ``rs.initiate()`` in mongosh.
+"""
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timezone
+from pymongo.errors import OperationFailure, PyMongoError
+from database import get_database
+from cache import category_cache, invalidate_product, product_cache, product_list_cache, user_cache
+from catalog_events import index_product, unindex_product, load_search_indexes
+
+logger = logging.getLogger(__name__)
+
+NODE_ID = os.environ.get("CACHE_BUS_NODE_ID") or socket.gethostname()
+RETRY_DELAY_SECONDS = 5
+
+# Server error codes that make retrying pointless or require a fresh start
+CHANGE_STREAMS_UNSUPPORTED = 40573
+CHANGE_STREAM_HISTORY_LOST = 286
+
+_tasks: list = []
+
+def _handle_product_change(change: dict):
+    product_id = str(change["documentKey"]["_id"])
+    operation = change["operationType"]
+    updated_fields = change.get("updateDescription", {}).get("updatedFields", {})
+    document = change.get("fullDocument") or {}
+    # Counts may have changed; the registry itself is maintained by the writer
+    category_cache.clear()
+
+    if operation == "insert" or (operation == "update" and "category" not in updated_fields and document):
+        # Category unchanged: only its list pages can be affected
+        invalidate_product(product_id, document.get("category"))
+    else:
+        # Deletes, replaces and category moves: the previous category is unknown
+        product_cache.delete(product_id)
+        product_list_cache.clear()
+
+    # Keep the in-memory search indexes in step with other workers' writes
+    if document:
+        index_product(document)
+    elif operation == "delete":
+        unindex_product(product_id)
+
+def _handle_user_change(change: dict):
+    user_cache.delete(str(change["documentKey"]["_id"]))
+
+HANDLERS = {
+    "products": _handle_product_change,
+    "users": _handle_user_change
+}
+
+async def _reset_local_caches(collection_name: str):
+    if collection_name == "products":
+        product_cache.clear()
+        product_list_cache.clear()
+        category_cache.clear()
+        await load_search_indexes()
+    else:
+        user_cache.clear()
+
+async def _load_resume_token(collection_name: str):
+    database = await get_database()
+    state = await database.cache_bus_tokens.find_one({"_id": f"{NODE_ID}:{collection_name}"})
+    return state["token"] if state else None
+
+async def _save_resume_token(collection_name: str, token):
+    database = await get_database()
+    await database.cache_bus_tokens.update_one(
+        {"_id": f"{NODE_ID}:{collection_name}"},
+        {"$set": {"token": token, "updatedAt": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+async def _tail(collection_name: str):
+    handler = HANDLERS[collection_name]
+    while True:
+        try:
+            database = await get_database()
+            token = await _load_resume_token(collection_name)
+            options = {"full_document": "updateLookup"}
+            if token:
+                options["resume_after"] = token
+            else:
+                # No history to replay: start clean so nothing stale survives
+                await _reset_local_caches(collection_name)
+
+            async with database[collection_name].watch(**options) as stream:
+                logger.info(f"Cache bus listening on '{collection_name}' (resumed: {bool(token)})")
+                async for change in stream:
+                    handler(change)
+                    await _save_resume_token(collection_name, change["_id"])
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                logger.warning("Cache bus disabled: MongoDB is not running as a replica set")
+                return
+            if e.code == CHANGE_STREAM_HISTORY_LOST:
+                logger.warning(f"Cache bus resume token for '{collection_name}' expired, restarting stream")
+                database = await get_database()
+                await database.cache_bus_tokens.delete_one({"_id": f"{NODE_ID}:{collection_name}"})
+                continue
+            logger.error(f"Cache bus error on '{collection_name}': {e}")
+        except PyMongoError as e:
+            logger.error(f"Cache bus error on '{collection_name}': {e}")
+        # Events may have been missed while disconnected
+        await _reset_local_caches(collection_name)
+        await asyncio.sleep(RETRY_DELAY_SECONDS)
+
+def start_cache_bus():
+    """Start tailing the watched collections (called from the startup hook)"""
+    if os.environ.get("CACHE_BUS_ENABLED", "true").lower() != "true":
+        logger.info("Cache bus disabled by configuration")
+        return
+    for collection_name in HANDLERS:
+        _tasks.append(asyncio.create_task(_tail(collection_name)))
+
+async def stop_cache_bus():
+    """Cancel the change stream listeners (called from the shutdown hook)"""
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
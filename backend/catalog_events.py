@@ -0,0 +1,96 @@
+"""Side effects of product writes: cache invalidation and derived catalog data"""
+import asyncio
+from typing import Iterable, List, Optional
+from database import get_database
+from cache import invalidate_product, product_cache, product_list_cache
+from categories import apply_product_change, rebuild_categories
+from suggest import suggest_index
+from fuzzy_search import fuzzy_index
+from stats import record_stats
+
+# In-memory search structures fed from the products collection
+SEARCH_INDEXES = (suggest_index, fuzzy_index)
+SEARCH_INDEX_FIELDS = {"name": 1, "category": 1, "image": 1, "price": 1, "rating": 1, "reviews": 1}
+
+_rebuild_lock = asyncio.Lock()
+# Product changes seen while a rebuild runs, replayed on the new indexes
+_pending: Optional[List[tuple]] = None
+
+def index_product(product: dict):
+    for index in SEARCH_INDEXES:
+        index.upsert(product)
+    if _pending is not None:
+        _pending.append((product, None))
+
+def unindex_product(product_id: str):
+    for index in SEARCH_INDEXES:
+        index.remove(product_id)
+    if _pending is not None:
+        _pending.append((None, product_id))
+
+def build_search_indexes(products: Iterable[dict]) -> list:
+    """Fresh instances of the search indexes (CPU-bound, run in a thread)"""
+    products = list(products)
+    built = []
+    for index in SEARCH_INDEXES:
+        fresh = type(index)()
+        fresh.rebuild(products)
+        built.append(fresh)
+    return built
+
+async def load_search_indexes():
+    """(Re)build the in-memory search indexes from the products collection.
+
+    The indexes are built in a worker thread, so requests keep being served
+    from the current ones until the new ones are swapped in.
+    """
+    global _pending
+    async with _rebuild_lock:
+        _pending = []
+        try:
+            database = await get_database()
+            products = await database.products.find({}, SEARCH_INDEX_FIELDS).to_list(length=None)
+            built = await asyncio.to_thread(build_search_indexes, products)
+            # Swap and replay without yielding to the event loop in between
+            for index, fresh in zip(SEARCH_INDEXES, built):
+                index.replace(fresh)
+            for product, product_id in _pending:
+                for index in SEARCH_INDEXES:
+                    if product is not None:
+                        index.upsert(product)
+                    else:
+                        index.remove(product_id)
+        except Exception as e:
+            print(f"Error loading search indexes: {e}")
+        finally:
+            _pending = None
+
+async def product_written(product_id: str, before: Optional[dict], after: Optional[dict]):
+    """Call after a single product create (before=None), update or delete (after=None)"""
+    invalidate_product(
+        product_id,
+        before.get("category") if before else None,
+        after.get("category") if after else None
+    )
+    if after:
+        index_product(after)
+    else:
+        unindex_product(product_id)
+    await apply_product_change(before, after)
+    if not before or not after:
+        await record_stats({"products": 1 if after else -1})
+
+async def stock_status_changed(product_id: str, category: Optional[str], in_stock: bool):
+    """Call after ``inStock`` was flipped by the inventory counters"""
+    invalidate_product(product_id, category)
+    await apply_product_change(
+        {"category": category, "inStock": not in_stock},
+        {"category": category, "inStock": in_stock}
+    )
+
+async def catalog_reloaded():
+    """Call after bulk writes touching an unknown set of products"""
+    product_cache.clear()
+    product_list_cache.clear()
+    await load_search_indexes()
+    await rebuild_categories()
@@ -0,0 +1,136 @@
+"""Materialized category registry maintained on product writes"""
+from typing import Iterable, Optional
+from pymongo import ASCENDING, DESCENDING
+from database import get_database
+from cache import category_cache
+
+# Display names of the known category slugs; other slugs are title-cased
+CATEGORY_NAMES = {
+    "sacs-a-main": "Sacs à Main",
+    "chaussures-femmes": "Chaussures Femmes",
+    "chaussures-enfants": "Chaussures Enfants",
+    "bijoux": "Bijoux"
+}
+
+ALL_PRODUCTS_SLUG = "tous"
+ALL_PRODUCTS_NAME = "Tous les produits"
+
+CATEGORY_LIST_CACHE_KEY = "list"
+
+def category_name(slug: str) -> str:
+    return CATEGORY_NAMES.get(slug) or slug.replace("-", " ").replace("_", " ").title()
+
+def _in_stock(product: dict) -> int:
+    return 1 if product.get("inStock", True) else 0
+
+async def _recompute_price_bounds(categories_collection, products_collection, slug: str):
+    """Reset min/max price of one category from the (category, price) index"""
+    cheapest = await products_collection.find_one(
+        {"category": slug, "price": {"$type": "number"}}, {"price": 1}, sort=[("price", ASCENDING)]
+    )
+    priciest = await products_collection.find_one(
+        {"category": slug, "price": {"$type": "number"}}, {"price": 1}, sort=[("price", DESCENDING)]
+    )
+    await categories_collection.update_one(
+        {"_id": slug},
+        {"$set": {
+            "minPrice": cheapest["price"] if cheapest else None,
+            "maxPrice": priciest["price"] if priciest else None
+        }}
+    )
+
+async def apply_product_change(before: Optional[dict], after: Optional[dict]):
+    """Update category counters for one product create (before=None), update or delete (after=None)"""
+    database = await get_database()
+    categories = database.categories
+
+    deltas = {}
+    for product, sign in ((before, -1), (after, 1)):
+        if product and product.get("category"):
+            delta = deltas.setdefault(product["category"], {"count": 0, "inStockCount": 0})
+            delta["count"] += sign
+            delta["inStockCount"] += sign * _in_stock(product)
+
+    for slug, delta in deltas.items():
+        update = {
+            "$inc": delta,
+            "$setOnInsert": {"name": category_name(slug)}
+        }
+        # Prices can only widen the bounds incrementally
+        if after and after.get("category") == slug and isinstance(after.get("price"), (int, float)):
+            update["$min"] = {"minPrice": after["price"]}
+            update["$max"] = {"maxPrice": after["price"]}
+        await categories.update_one({"_id": slug}, update, upsert=True)
+
+    # A removed or cheaper/pricier product may have been a bound: re-read it
+    # from the index for the category it left
+    if before and before.get("category"):
+        moved = not after or after.get("category") != before["category"]
+        if moved or after.get("price") != before.get("price"):
+            await _recompute_price_bounds(categories, database.products, before["category"])
+
+    category_cache.clear()
+
+async def rebuild_categories(slugs: Optional[Iterable[str]] = None):
+    """Recompute the registry from the products collection (all or some categories)"""
+    database = await get_database()
+    match = {"category": {"$in": list(slugs)}} if slugs is not None else {}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": "$category",
+            "count": {"$sum": 1},
+            "inStockCount": {"$sum": {"$cond": [{"$eq": ["$inStock", False]}, 0, 1]}},
+            "minPrice": {"$min": "$price"},
+            "maxPrice": {"$max": "$price"}
+        }}
+    ]
+    rows = await database.products.aggregate(pipeline).to_list(length=None)
+
+    if slugs is None:
+        await database.categories.delete_many({"_id": {"$nin": [row["_id"] for row in rows]}})
+    else:
+        await database.categories.delete_many({"_id": {"$in": list(slugs)}})
+    for row in rows:
+        if not row["_id"]:
+            continue
+        row["name"] = category_name(row["_id"])
+        await database.categories.replace_one({"_id": row["_id"]}, row, upsert=True)
+
+    category_cache.clear()
+
+async def ensure_categories():
+    """Build the registry on first start"""
+    try:
+        database = await get_database()
+        if not await database.categories.find_one({}, {"_id": 1}):
+            await rebuild_categories()
+    except Exception as e:
+        print(f"Error building category registry: {e}")
+
+async def list_categories() -> list:
+    """Categories with products, preceded by the "all products" entry"""
+    cached = category_cache.get(CATEGORY_LIST_CACHE_KEY)
+    if cached is not None:
+        return cached
+
+    database = await get_database()
+    rows = await database.categories.find({"count": {"$gt": 0}}).sort("name", ASCENDING).to_list(length=None)
+
+    def entry(slug, name, rows):
+        prices_min = [r["minPrice"] for r in rows if r.get("minPrice") is not None]
+        prices_max = [r["maxPrice"] for r in rows if r.get("maxPrice") is not None]
+        return {
+            "id": slug,
+            "name": name,
+            "slug": slug,
+            "count": sum(r.get("count", 0) for r in rows),
+            "inStockCount": sum(r.get("inStockCount", 0) for r in rows),
+            "minPrice": min(prices_min) if prices_min else None,
+            "maxPrice": max(prices_max) if prices_max else None
+        }
+
+    result = [entry(ALL_PRODUCTS_SLUG, ALL_PRODUCTS_NAME, rows)]
+    result += [entry(row["_id"], row.get("name") or category_name(row["_id"]), [row]) for row in rows]
+    category_cache.set(CATEGORY_LIST_CACHE_KEY, result)
+    return result
@@ -1,6 +1,7 @@
 import motor.motor_asyncio
 import os
 from typing import Optional
+from pymongo import ASCENDING, DESCENDING, TEXT
 
 class Database:
     client: Optional[motor.motor_asyncio.AsyncIOMotorClient] = None
@@ -26,6 +27,74 @@ async def connect_to_mongo():
     except Exception as e:
         print(f"Error connecting to MongoDB: {e}")
 
+# (collection, keys, options) of the indexes the API queries rely on
+INDEXES = [
+    # Weighted full-text index for product search: name matches rank above
+    # description matches, and French stemming lets "sacs" match "sac".
+    ("products", [("name", TEXT), ("description", TEXT)], {
+        "name": "product_search",
+        "weights": {"name": 10, "description": 2},
+        "default_language": "french",
+        "language_override": "searchLanguage"
+    }),
+
+    # Keyset pagination: every listing sorts on (createdAt, _id) newest
+    # first, optionally behind an equality filter
+    ("products", [("createdAt", DESCENDING), ("_id", DESCENDING)], {}),
+    ("products", [("category", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], {}),
+    ("orders", [("createdAt", DESCENDING), ("_id", DESCENDING)], {}),
+    ("orders", [("userId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], {}),
+    # Admin order queue: one status (or a few, merged) by creation date
+    ("orders", [("status", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], {}),
+    # Archival job: finished orders by age
+    ("orders", [("status", ASCENDING), ("updatedAt", ASCENDING)], {}),
+    # Fails while orders numbered by the former random scheme still collide
+    ("orders", "orderId", {"unique": True}),
+
+    # Faceted filters: multikey indexes on the variant arrays, price ranges
+    ("products", "colors", {}),
+    ("products", "sizes", {}),
+    ("products", [("category", ASCENDING), ("price", ASCENDING)], {}),
+    ("products", "price", {}),
+
+    # Bulk imports upsert on SKU; products created without one are not indexed
+    ("products", "sku", {"unique": True, "partialFilterExpression": {"sku": {"$type": "string"}}}),
+
+    # Checkout stock holds: the sweeper reads expired holds from the
+    # (status, expiresAt) index; closed holds are purged a week later
+    ("stock_reservations", [("status", ASCENDING), ("expiresAt", ASCENDING)], {}),
+    ("stock_reservations", "closedAt", {"expireAfterSeconds": 7 * 24 * 3600}),
+    ("stock_reservations", "sessionId", {"sparse": True}),
+    ("payment_transactions", "sessionId", {}),
+
+    # Admin customer lookup: anchored prefix regexes on the search keys
+    ("users", "searchKeys", {}),
+    # Order queue customer filter (and login, registration) look users up by email
+    ("users", "email", {}),
+
+    # Stored responses of Idempotency-Key requests expire after a day
+    ("idempotency_keys", "createdAt", {"expireAfterSeconds": 24 * 3600}),
+]
+
+async def create_indexes():
+    """Create the indexes the API queries rely on (idempotent).
+
+    Each index is created on its own, so one that cannot be built (e.g. a
+    conflicting existing definition) does not keep the others from being.
+    """
+    database = await get_database()
+    failed = 0
+    for collection, keys, options in INDEXES:
+        try:
+            await database[collection].create_index(keys, **options)
+        except Exception as e:
+            failed += 1
+            print(f"Error creating index {keys} on {collection}: {e}")
+    if failed:
+        print(f"MongoDB indexes ensured, {failed} failed")
+    else:
+        print("MongoDB indexes ensured")
+
 async def close_mongo_connection():
     """Close database connection"""
     if db.client:
@@ -45,6 +114,14 @@ async def get_orders_collection():
     database = await get_database()
     return database.orders
 
+async def get_orders_archive_collection():
+    database = await get_database()
+    return database.orders_archive
+
 async def get_payment_transactions_collection():
     database = await get_database()
-    return database.payment_transactions
\ No newline at end of file
+    return database.payment_transactions
+
+async def get_stock_reservations_collection():
+    database = await get_database()
+    return database.stock_reservations
@@ -0,0 +1,133 @@
+"""Typo-tolerant, accent-insensitive product search over an in-memory trigram index"""
+import heapq
+from collections import Counter
+from typing import Iterable, List, Tuple
+from categories import category_name
+from text_utils import normalize
+
+# Trigrams shared by more products than this are too common to select
+# candidates (like stop words); the rarer trigrams of the query are enough
+MAX_POSTING_SIZE = 5000
+# Candidates re-scored with edit distance after the trigram pass
+RESCORE_CANDIDATES = 100
+MIN_TRIGRAM_COVERAGE = 0.3
+MAX_RESULTS = 500
+
+def trigrams(token: str) -> set:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+def _token_similarity(query_token: str, product_tokens: List[str]) -> float:
+    """Best similarity of a query token to a product token (prefixes count as typed so far)"""
+    best = 0.0
+    for token in product_tokens:
+        if token.startswith(query_token):
+            return 1.0
+        candidate = token[:len(query_token) + 1] if len(token) > len(query_token) else token
+        distance = edit_distance(query_token, candidate)
+        best = max(best, 1 - distance / max(len(query_token), len(candidate)))
+    return best
+
+class TrigramIndex:
+    """Inverted index from accent-folded trigrams to product ids"""
+
+    def __init__(self):
+        self._postings: dict = {}
+        self._products: dict = {}
+
+    def __len__(self):
+        return len(self._products)
+
+    @staticmethod
+    def _tokens_for(product: dict) -> List[str]:
+        text = product.get("name") or ""
+        if product.get("category"):
+            text += " " + category_name(product["category"])
+        return normalize(text).split()
+
+    def upsert(self, product: dict):
+        """Add or refresh one product (document with ``_id`` or ``id``)"""
+        product_id = str(product.get("id") or product["_id"])
+        self.remove(product_id)
+        tokens = self._tokens_for(product)
+        grams = set().union(*(trigrams(token) for token in tokens)) if tokens else set()
+        self._products[product_id] = (tokens, grams)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(product_id)
+
+    def remove(self, product_id: str):
+        entry = self._products.pop(product_id, None)
+        if not entry:
+            return
+        for gram in entry[1]:
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(product_id)
+                if not posting:
+                    del self._postings[gram]
+
+    def rebuild(self, products: Iterable[dict]):
+        self._postings = {}
+        self._products = {}
+        for product in products:
+            self.upsert(product)
+
+    def replace(self, other: "TrigramIndex"):
+        """Take over the contents of an index built elsewhere (e.g. in a thread)"""
+        self._postings, self._products = other._postings, other._products
+
+    def search(self, query: str, limit: int = MAX_RESULTS) -> List[Tuple[str, float]]:
+        """Product ids ranked by trigram coverage and edit-distance similarity"""
+        query_tokens = normalize(query).split()
+        if not query_tokens:
+            return []
+        query_grams = set().union(*(trigrams(token) for token in query_tokens))
+
+        # Candidate selection from the rarest trigrams only; counting is done
+        # by Counter in C and only the best candidates are scored in Python
+        postings = sorted(
+            (self._postings[gram] for gram in query_grams if gram in self._postings),
+            key=len
+        )
+        selective = [p for p in postings if len(p) <= MAX_POSTING_SIZE]
+        if selective:
+            counts = Counter()
+            for posting in selective:
+                counts.update(posting)
+            shortlist = [product_id for product_id, _ in counts.most_common(RESCORE_CANDIDATES * 2)]
+        elif postings:
+            # Only common trigrams: products holding the two rarest ones
+            common = postings[0] & postings[1] if len(postings) > 1 else postings[0]
+            shortlist = list(common)[:RESCORE_CANDIDATES * 2]
+        else:
+            return []
+
+        # Coverage: share of the query trigrams present in the product
+        scored = []
+        for product_id in shortlist:
+            coverage = len(query_grams & self._products[product_id][1]) / len(query_grams)
+            if coverage >= MIN_TRIGRAM_COVERAGE:
+                scored.append((coverage, product_id))
+        candidates = heapq.nlargest(RESCORE_CANDIDATES, scored)
+
+        results = []
+        for coverage, product_id in candidates:
+            tokens = self._products[product_id][0]
+            similarity = sum(_token_similarity(t, tokens) for t in query_tokens) / len(query_tokens)
+            results.append((product_id, round(0.5 * coverage + 0.5 * similarity, 4)))
+        results.sort(key=lambda item: -item[1])
+        return results[:limit]
+
+fuzzy_index = TrigramIndex()
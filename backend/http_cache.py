@@ -0,0 +1,55 @@
+"""ETag / conditional GET helpers"""
+import hashlib
+from datetime import datetime
+from typing import Iterable, Optional
+import bson
+from fastapi import Request, Response
+
+# Cache-Control policies per kind of resource. Catalog data may be reused
+# briefly by browsers and shared caches; order data is private and always
+# revalidated, which is cheap thanks to the ETag.
+CATALOG_LIST_CACHE_CONTROL = "public, max-age=60, must-revalidate"
+CATALOG_ITEM_CACHE_CONTROL = "public, max-age=300, must-revalidate"
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+def _version(document: dict) -> bytes:
+    """Stable version marker of a document: its updatedAt, or a content hash"""
+    updated_at = document.get("updatedAt")
+    if isinstance(updated_at, datetime):
+        return updated_at.isoformat().encode()
+    return hashlib.blake2b(bson.encode(document), digest_size=16).digest()
+
+def documents_etag(documents: Iterable[dict], variant: str = "") -> str:
+    """Strong ETag for a representation built from ``documents``.
+
+    ``variant`` distinguishes representations of the same documents (query
+    parameters, projections, requesting user...).
+    """
+    digest = hashlib.blake2b(variant.encode(), digest_size=16)
+    for document in documents:
+        document_id = document.get("id", document.get("_id"))
+        digest.update(str(document_id).encode())
+        digest.update(_version(document))
+    return f'"{digest.hexdigest()}"'
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already matches ``etag``"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip() for tag in header.split(",")}
+    return etag in candidates or f"W/{etag}" in candidates
+
+def conditional(request: Request, response: Response, etag: str, cache_control: str,
+                extra_headers: Optional[dict] = None) -> Optional[Response]:
+    """Set validator headers and return a 304 response when the client is up to date.
+
+    Callers return the 304 as-is so the body is never serialized.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control, **(extra_headers or {})}
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,191 @@
+"""Idempotency-Key support for non-idempotent POST endpoints
+
+A retried request carrying the same ``Idempotency-Key`` gets the stored
+response of the first attempt instead of running again; duplicates arriving
+while the first attempt is still running wait for it and share its response.
+An attempt holds its record for a lease: if its worker dies, the next
+duplicate takes the expired lease over and runs the request itself.
+Records live in the ``idempotency_keys`` collection and expire with a TTL index.
+"""
+import asyncio
+import hashlib
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional
+from pymongo.errors import DuplicateKeyError
+from auth import token_subject
+from database import get_database
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+# Another worker owns the first attempt: poll its record until it completes
+POLL_INTERVAL_SECONDS = 0.1
+# How long an attempt may run before a duplicate can take its record over
+LEASE_SECONDS = 30
+# Response headers worth replaying; the rest is recomputed by the stack
+REPLAYED_HEADERS = {"content-type", "location", "x-next-cursor"}
+
+def _caller_scope(headers: dict, fingerprint: str) -> bytes:
+    """Who a key belongs to: the authenticated user, whatever token they use.
+
+    Anonymous callers (guest checkout, or a token that does not validate)
+    share no identity, so their key is scoped to the exact request: only an
+    identical retry, which already holds everything it carries, is replayed.
+    """
+    scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+    user_id = token_subject(token.strip()) if scheme.lower() == "bearer" and token.strip() else None
+    if user_id:
+        return f"user:{user_id}".encode()
+    return f"anonymous:{fingerprint}".encode()
+
+def _json_response(status_code: int, detail: str) -> dict:
+    return {
+        "statusCode": status_code,
+        "headers": [["content-type", "application/json"]],
+        "body": json.dumps({"detail": detail}).encode()
+    }
+
+class IdempotencyMiddleware:
+    """Pure ASGI middleware (the body is buffered, never re-serialized)"""
+
+    def __init__(self, app, paths: Iterable[str]):
+        self.app = app
+        self.paths = set(paths)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        key = headers.get(IDEMPOTENCY_HEADER.encode(), b"").decode("latin-1").strip()
+        if not key:
+            return await self.app(scope, receive, send)
+        if len(key) > MAX_KEY_LENGTH:
+            return await self._send(send, _json_response(400, "Idempotency-Key is too long"))
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        # Keys are scoped to the caller, so two users can never share a response
+        fingerprint = hashlib.sha256(scope["path"].encode() + b"\0" + body).hexdigest()
+        record_id = hashlib.sha256(_caller_scope(headers, fingerprint) + b"\0" + key.encode()).hexdigest()
+
+        database = await get_database()
+        records = database.idempotency_keys
+        lease = uuid.uuid4().hex
+        now = datetime.now(timezone.utc)
+        try:
+            await records.insert_one({
+                "_id": record_id,
+                "fingerprint": fingerprint,
+                "status": "in_progress",
+                "lease": lease,
+                "lockedUntil": now + timedelta(seconds=LEASE_SECONDS),
+                "createdAt": now
+            })
+        except DuplicateKeyError:
+            stored = await self._previous_response(records, record_id, fingerprint, lease)
+            if stored is not None:
+                return await self._send(send, stored, replayed=True)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[record_id] = future
+        try:
+            stored = await self._run(scope, body, send)
+            # Past its lease the record may belong to a duplicate now: leave it alone
+            if stored and stored["statusCode"] < 500:
+                await records.update_one(
+                    {"_id": record_id, "lease": lease},
+                    {"$set": {"status": "completed", **stored}, "$unset": {"lease": "", "lockedUntil": ""}}
+                )
+            else:
+                # Server errors are not final: let the client retry for real
+                stored = None
+                await records.delete_one({"_id": record_id, "lease": lease})
+            future.set_result(stored)
+        except BaseException:
+            await records.delete_one({"_id": record_id, "lease": lease})
+            future.set_result(None)
+            raise
+        finally:
+            self._inflight.pop(record_id, None)
+
+    async def _run(self, scope, body: bytes, send) -> Optional[dict]:
+        """Call the app with the buffered body and capture what it sends"""
+        delivered = False
+
+        async def receive():
+            nonlocal delivered
+            if delivered:
+                return {"type": "http.disconnect"}
+            delivered = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        captured = {"statusCode": None, "headers": [], "body": b""}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                captured["statusCode"] = message["status"]
+                captured["headers"] = [
+                    [name.decode("latin-1"), value.decode("latin-1")]
+                    for name, value in message.get("headers", [])
+                    if name.decode("latin-1").lower() in REPLAYED_HEADERS
+                ]
+            elif message["type"] == "http.response.body":
+                captured["body"] += message.get("body", b"")
+            await send(message)
+
+        await self.app(scope, receive, capture)
+        return captured if captured["statusCode"] is not None else None
+
+    async def _previous_response(self, records, record_id: str, fingerprint: str, lease: str) -> Optional[dict]:
+        """Response of the first attempt, waiting for it if it is still running.
+
+        None when the first attempt's lease expired and this request took the
+        record over under ``lease``: it must run the request itself.
+        """
+        future = self._inflight.get(record_id)
+        if future is not None:
+            await asyncio.shield(future)
+
+        while True:
+            record = await records.find_one({"_id": record_id})
+            if record is None:
+                # The first attempt failed; the client must retry
+                return _json_response(409, "The original request failed, retry it")
+            if record["fingerprint"] != fingerprint:
+                return _json_response(422, "Idempotency-Key was already used for a different request")
+            if record["status"] == "completed":
+                return record
+            now = datetime.now(timezone.utc)
+            taken_over = await records.find_one_and_update(
+                {
+                    "_id": record_id,
+                    "status": "in_progress",
+                    # Records written before leases existed expire from their creation
+                    "$or": [
+                        {"lockedUntil": {"$lte": now}},
+                        {"lockedUntil": {"$exists": False}, "createdAt": {"$lte": now - timedelta(seconds=LEASE_SECONDS)}}
+                    ]
+                },
+                {"$set": {"lease": lease, "lockedUntil": now + timedelta(seconds=LEASE_SECONDS)}}
+            )
+            if taken_over is not None:
+                return None
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    @staticmethod
+    async def _send(send, stored: dict, replayed: bool = False):
+        headers = [[name.encode("latin-1"), value.encode("latin-1")] for name, value in stored["headers"]]
+        body = bytes(stored["body"])
+        headers.append([b"content-length", str(len(body)).encode()])
+        if replayed and stored.get("status") == "completed":
+            headers.append([REPLAYED_HEADER.encode(), b"true"])
+        await send({"type": "http.response.start", "status": stored["statusCode"], "headers": headers})
+        await send({"type": "http.response.body", "body": body})
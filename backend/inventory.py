@@ -0,0 +1,125 @@
+"""Per-variant stock counters with atomic conditional decrements
+
+Products may carry ``variants: [{color, size, quantity}]``. Products without
+variants are not stock-tracked and only honour their ``inStock`` flag.
+"""
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set
+from bson import ObjectId
+from pymongo import ReturnDocument
+from database import get_products_collection
+from catalog_events import stock_status_changed
+
+class InsufficientStock(Exception):
+    """Raised when at least one line cannot be served; nothing is decremented"""
+
+    def __init__(self, items: List[dict]):
+        super().__init__("Insufficient stock")
+        self.items = items
+
+def variants_in_stock(variants: Iterable[dict]) -> bool:
+    return any(variant.get("quantity", 0) > 0 for variant in variants)
+
+def canonical_product_id(product_id) -> str:
+    """``str(ObjectId)`` form of an id, so "5FAB..." and "5fab..." are one product"""
+    product_id = str(product_id)
+    return str(ObjectId(product_id)) if ObjectId.is_valid(product_id) else product_id
+
+def stock_lines(items: Iterable[dict]) -> List[dict]:
+    """Merge order/cart items into one line per (product, color, size)"""
+    merged: Dict[tuple, dict] = {}
+    for item in items:
+        product_id = canonical_product_id(item.get("productId") or item.get("id"))
+        key = (product_id, item.get("selectedColor"), item.get("selectedSize"))
+        line = merged.setdefault(key, {
+            "productId": product_id,
+            "color": item.get("selectedColor"),
+            "size": item.get("selectedSize"),
+            "quantity": 0
+        })
+        line["quantity"] += int(item.get("quantity") or 0)
+    return list(merged.values())
+
+async def tracked_product_ids(product_ids: Iterable[str]) -> Set[str]:
+    """Ids of the products that have variant stock counters"""
+    products = await get_products_collection()
+    ids = [ObjectId(product_id) for product_id in set(product_ids) if ObjectId.is_valid(product_id)]
+    cursor = products.find({"_id": {"$in": ids}, "variants.0": {"$exists": True}}, {"_id": 1})
+    return {str(product["_id"]) async for product in cursor}
+
+def _moved(variants: List[dict], line: dict, delta: int) -> List[dict]:
+    """The variants after ``delta`` was applied to the counter of ``line``"""
+    return [
+        {**variant, "quantity": variant.get("quantity", 0) + delta}
+        if (variant.get("color"), variant.get("size")) == (line["color"], line["size"]) else variant
+        for variant in variants
+    ]
+
+async def _apply(line: dict, sign: int) -> Optional[dict]:
+    """Atomically move one variant counter; a decrement only matches if enough stock is left.
+
+    ``inStock`` is recomputed from the counters in the same (pipeline) update,
+    so the flag can never lag behind concurrent orders and rollbacks. Returns
+    the product as it was before the update, or None when nothing matched.
+    """
+    products = await get_products_collection()
+    delta = sign * line["quantity"]
+    variant = {"color": line["color"], "size": line["size"]}
+    if sign < 0:
+        variant["quantity"] = {"$gte": line["quantity"]}
+    same_variant = {"$and": [
+        {"$eq": ["$$this.color", {"$literal": line["color"]}]},
+        {"$eq": ["$$this.size", {"$literal": line["size"]}]}
+    ]}
+    before = await products.find_one_and_update(
+        {"_id": ObjectId(line["productId"]), "variants": {"$elemMatch": variant}},
+        [
+            {"$set": {
+                "variants": {"$map": {"input": "$variants", "in": {"$cond": [
+                    same_variant,
+                    {"$mergeObjects": ["$$this", {"quantity": {"$add": ["$$this.quantity", delta]}}]},
+                    "$$this"
+                ]}}},
+                "updatedAt": datetime.now(timezone.utc)
+            }},
+            {"$set": {"inStock": {"$anyElementTrue": [
+                {"$map": {"input": "$variants", "in": {"$gt": ["$$this.quantity", 0]}}}
+            ]}}}
+        ],
+        projection={"category": 1, "inStock": 1, "variants": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is not None:
+        available = variants_in_stock(_moved(before.get("variants", []), line, delta))
+        if available != before.get("inStock", True):
+            await stock_status_changed(str(before["_id"]), before.get("category"), available)
+    return before
+
+async def decrement_stock(lines: List[dict], tracked: Optional[Set[str]] = None):
+    """Take all lines or none: on any shortage the applied decrements are rolled back"""
+    if tracked is None:
+        tracked = await tracked_product_ids(line["productId"] for line in lines)
+    lines = [line for line in lines if line["productId"] in tracked and line["quantity"] > 0]
+    if not lines:
+        return
+
+    # Lines touch different counters, so they are sent concurrently
+    results = await asyncio.gather(*(_apply(line, -1) for line in lines))
+    failed = [line for line, document in zip(lines, results) if document is None]
+    if failed:
+        applied = [line for line, document in zip(lines, results) if document is not None]
+        await asyncio.gather(*(_apply(line, 1) for line in applied))
+        raise InsufficientStock([
+            {"productId": line["productId"], "color": line["color"], "size": line["size"], "requested": line["quantity"]}
+            for line in failed
+        ])
+
+async def restore_stock(lines: List[dict], tracked: Optional[Set[str]] = None):
+    """Give stock back (cancellations, expired holds)"""
+    if tracked is None:
+        tracked = await tracked_product_ids(line["productId"] for line in lines)
+    lines = [line for line in lines if line["productId"] in tracked and line["quantity"] > 0]
+    if not lines:
+        return
+    await asyncio.gather(*(_apply(line, 1) for line in lines))
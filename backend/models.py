@@ -68,6 +68,11 @@ class UserResponse(BaseModel):
     isActive: bool
 
 # Product Models
+class ProductVariant(BaseModel):
+    color: str
+    size: str
+    quantity: int = Field(default=0, ge=0)  # Units left for this color/size
+
 class Product(BaseModel):
     id: Optional[str] = Field(default=None, alias="_id")
     name: str
@@ -79,6 +84,8 @@ class Product(BaseModel):
     colors: List[str] = []
     sizes: List[str] = []
     inStock: bool = True
+    sku: Optional[str] = None  # Stable catalog key used by bulk imports
+    variants: List[ProductVariant] = []  # Stock per color/size; empty means untracked
     rating: float = 4.0
     reviews: int = 0
     createdAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -99,6 +106,8 @@ class ProductCreate(BaseModel):
     colors: List[str] = []
     sizes: List[str] = []
     inStock: bool = True
+    sku: Optional[str] = None
+    variants: Optional[List[ProductVariant]] = None
 
 class ProductUpdate(BaseModel):
     name: Optional[str] = None
@@ -110,23 +119,27 @@ class ProductUpdate(BaseModel):
     colors: Optional[List[str]] = None
     sizes: Optional[List[str]] = None
     inStock: Optional[bool] = None
+    sku: Optional[str] = None
+    variants: Optional[List[ProductVariant]] = None
 
 # Order Models
 class OrderItem(BaseModel):
     productId: str
     name: str
     price: float
-    quantity: int
+    quantity: int = Field(..., gt=0)
     selectedColor: str
     selectedSize: str
     image: str
+    category: Optional[str] = None  # Filled in by the server, for the analytics
 
 class Order(BaseModel):
     id: Optional[str] = Field(default=None, alias="_id")
     userId: str
     orderId: str  # Human readable order ID like CMD001
     items: List[OrderItem]
-    status: str = "processing"  # processing, shipped, delivered, cancelled
+    status: str = "processing"  # processing, paid, shipped, delivered, cancelled
+    statusHistory: List[Dict[str, Any]] = []
     total: float
     subtotal: float
     shipping: float
@@ -144,6 +157,16 @@ class OrderCreate(BaseModel):
     items: List[OrderItem]
     shippingAddress: Dict[str, str]
 
+class OrderStatusUpdate(BaseModel):
+    status: str
+
+class OrderStatusChange(BaseModel):
+    orderId: str
+    status: str
+
+class BulkOrderStatusUpdate(BaseModel):
+    updates: List[OrderStatusChange] = Field(..., min_length=1, max_length=5000)
+
 # Payment Models
 class PaymentTransaction(BaseModel):
     id: Optional[str] = Field(default=None, alias="_id")
@@ -183,7 +206,7 @@ class CartItem(BaseModel):
     image: str
     selectedColor: str
     selectedSize: str
-    quantity: int
+    quantity: int = Field(..., gt=0)
 
 class CheckoutRequest(BaseModel):
     items: List[CartItem]
@@ -0,0 +1,94 @@
+"""Cold storage for finished orders
+
+Delivered and cancelled orders that have not changed for
+``ORDER_ARCHIVE_AFTER_DAYS`` move from ``orders`` to ``orders_archive``, so
+the hot collection and its indexes only hold the orders still being worked
+on. Reads that may concern an old order fall back to the archive.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from pymongo import ASCENDING, DESCENDING, ReplaceOne
+from pymongo.errors import CollectionInvalid
+from database import get_database, get_orders_collection, get_orders_archive_collection
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_STATUSES = ["delivered", "cancelled"]
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ORDER_ARCHIVE_AFTER_DAYS", "180"))
+# WiredTiger block compressor of the archive collection ("" for the server default)
+ARCHIVE_COMPRESSOR = os.environ.get("ORDER_ARCHIVE_COMPRESSOR", "zstd")
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_INTERVAL_SECONDS = 3600
+
+_archiver: Optional[asyncio.Task] = None
+
+async def ensure_order_archive():
+    """Create the archive collection (compressed) and its indexes"""
+    try:
+        database = await get_database()
+        options = {}
+        if ARCHIVE_COMPRESSOR:
+            options["storageEngine"] = {"wiredTiger": {"configString": f"block_compressor={ARCHIVE_COMPRESSOR}"}}
+        try:
+            await database.create_collection("orders_archive", **options)
+        except CollectionInvalid:
+            pass  # Already there
+
+        archive = database.orders_archive
+        await archive.create_index([("userId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)])
+        await archive.create_index("orderId")
+        # Rollup recounts read one period of orders
+        await archive.create_index([("createdAt", DESCENDING), ("_id", DESCENDING)])
+    except Exception as e:
+        print(f"Error preparing the order archive: {e}")
+
+async def archive_orders(older_than_days: int = ARCHIVE_AFTER_DAYS) -> int:
+    """Move finished orders untouched for ``older_than_days`` to the archive"""
+    orders = await get_orders_collection()
+    archive = await get_orders_archive_collection()
+    query = {
+        "status": {"$in": ARCHIVED_STATUSES},
+        "updatedAt": {"$lt": datetime.now(timezone.utc) - timedelta(days=older_than_days)}
+    }
+
+    moved = 0
+    while True:
+        batch = await orders.find(query).limit(ARCHIVE_BATCH_SIZE).to_list(length=ARCHIVE_BATCH_SIZE)
+        if not batch:
+            return moved
+        # Copy first (replaces make a rerun after a crash harmless), then
+        # delete what was copied; finished orders no longer change
+        await archive.bulk_write(
+            [ReplaceOne({"_id": order["_id"]}, order, upsert=True) for order in batch],
+            ordered=False
+        )
+        result = await orders.delete_many({"_id": {"$in": [order["_id"] for order in batch]}})
+        moved += result.deleted_count
+
+async def _archive_periodically():
+    while True:
+        try:
+            moved = await archive_orders()
+            if moved:
+                logger.info(f"Archived {moved} orders")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error archiving orders: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+def start_order_archiver():
+    """Start the archival job (called from the startup hook)"""
+    global _archiver
+    _archiver = asyncio.create_task(_archive_periodically())
+
+async def stop_order_archiver():
+    """Cancel the archival job (called from the shutdown hook)"""
+    global _archiver
+    if _archiver:
+        _archiver.cancel()
+        await asyncio.gather(_archiver, return_exceptions=True)
+        _archiver = None
@@ -0,0 +1,34 @@
+"""Side effects of order writes: derived counters and rollups
+
+Every hook takes a batch so bulk operations pay one write per batch.
+"""
+from collections import Counter
+from typing import Iterable, Tuple
+from stats import order_delta, record_stats
+from rollups import apply_order_changes
+
+async def orders_created(orders: Iterable[dict]):
+    orders = list(orders)
+    delta = Counter()
+    for order in orders:
+        delta.update(order_delta(order))
+    await record_stats(delta)
+    await apply_order_changes((None, order) for order in orders)
+
+async def orders_status_changed(changes: Iterable[Tuple[dict, str]]):
+    """``changes`` holds (order as it was before, new status) pairs"""
+    changes = [(before, {**before, "status": new_status}) for before, new_status in changes]
+    delta = Counter()
+    for before, after in changes:
+        delta.update(order_delta(before, -1))
+        delta.update(order_delta(after))
+    await record_stats(delta)
+    await apply_order_changes(changes)
+
+async def orders_deleted(orders: Iterable[dict]):
+    orders = list(orders)
+    delta = Counter()
+    for order in orders:
+        delta.update(order_delta(order, -1))
+    await record_stats(delta)
+    await apply_order_changes((order, None) for order in orders)
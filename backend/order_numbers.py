@@ -0,0 +1,44 @@
+"""Human readable order numbers (CMD000001, CMD000002, ...) allocated by block leasing
+
+Each worker leases a range of numbers from the ``counters`` collection with
+one atomic ``$inc`` and hands them out from memory. Numbers are unique and
+increase within a worker; a restart leaves the rest of its block unused.
+"""
+import asyncio
+import os
+from pymongo import ReturnDocument
+from database import get_database
+
+ORDER_NUMBER_PREFIX = "CMD"
+BLOCK_SIZE = int(os.environ.get("ORDER_NUMBER_BLOCK_SIZE", "50"))
+
+class OrderNumberAllocator:
+    def __init__(self, counter: str, block_size: int = BLOCK_SIZE):
+        self.counter = counter
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def _lease(self):
+        database = await get_database()
+        counter = await database.counters.find_one_and_update(
+            {"_id": self.counter},
+            {"$inc": {"value": self.block_size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._end = counter["value"]
+        self._next = self._end - self.block_size
+
+    async def allocate(self) -> int:
+        async with self._lock:
+            if self._next >= self._end:
+                await self._lease()
+            self._next += 1
+            return self._next
+
+order_numbers = OrderNumberAllocator("orderId")
+
+async def next_order_id() -> str:
+    return f"{ORDER_NUMBER_PREFIX}{await order_numbers.allocate():06d}"
@@ -0,0 +1,147 @@
+"""Order status transitions applied with one conditional write each"""
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument, UpdateOne
+from database import get_orders_collection
+from inventory import restore_stock, stock_lines
+from order_events import orders_status_changed
+
+# Statuses an order may move to from each status; "paid" orders come from
+# the Stripe checkout, "processing" ones from the direct order endpoint
+ALLOWED_TRANSITIONS: Dict[str, Set[str]] = {
+    "processing": {"shipped", "cancelled"},
+    "paid": {"shipped", "cancelled"},
+    "shipped": {"delivered"},
+    "delivered": set(),
+    "cancelled": set()
+}
+ORDER_STATUSES = list(ALLOWED_TRANSITIONS)
+
+# What the bulk path needs of each order: the transition check, the stock
+# given back on cancel and the counters/rollups hooks
+BULK_FIELDS = {
+    "status": 1, "total": 1, "subtotal": 1, "shipping": 1, "items": 1, "createdAt": 1, "stockCommitted": 1
+}
+
+def sources_of(new_status: str) -> Set[str]:
+    """Statuses from which ``new_status`` can be reached"""
+    return {source for source, targets in ALLOWED_TRANSITIONS.items() if new_status in targets}
+
+async def transition_order(query: dict, new_status: str, changed_by: str,
+                           allowed_from: Optional[Iterable[str]] = None) -> dict:
+    """Move the order matching ``query`` to ``new_status`` and return its new version.
+
+    The allowed previous statuses are part of the filter, so concurrent
+    changes cannot both win; a failed match costs one extra read to tell
+    "not found" from "not allowed".
+    """
+    if new_status not in ALLOWED_TRANSITIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid status. Must be one of: {ORDER_STATUSES}"
+        )
+    sources = sources_of(new_status)
+    if allowed_from is not None:
+        sources &= set(allowed_from)
+
+    orders = await get_orders_collection()
+    now = datetime.now(timezone.utc)
+    before = await orders.find_one_and_update(
+        {**query, "status": {"$in": list(sources)}},
+        {
+            "$set": {"status": new_status, "updatedAt": now},
+            "$push": {"statusHistory": {"status": new_status, "at": now, "by": changed_by}}
+        },
+        return_document=ReturnDocument.BEFORE
+    )
+
+    if before is None:
+        current = await orders.find_one(query, {"status": 1})
+        if not current:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Order not found"
+            )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Order cannot go from '{current.get('status')}' to '{new_status}'"
+        )
+
+    order = {
+        **before,
+        "status": new_status,
+        "updatedAt": now,
+        "statusHistory": [*before.get("statusHistory", []), {"status": new_status, "at": now, "by": changed_by}]
+    }
+
+    # Only the write that won the transition gives the stock back, and only
+    # if the order took it (paid orders may have been oversold)
+    if new_status == "cancelled" and order.get("stockCommitted") is not False:
+        await restore_stock(stock_lines(order.get("items", [])))
+    await orders_status_changed([(before, new_status)])
+    return order
+
+async def transition_orders(changes: List[Tuple[ObjectId, str]], changed_by: str) -> Dict[ObjectId, str]:
+    """Apply many (order id, new status) changes, one per distinct order, with
+    one read and one bulk write.
+
+    Returns the reason for every order left unchanged. Each update is
+    conditioned on the status that was read, so an order changed in between
+    is reported instead of being moved from a status it no longer has.
+    """
+    orders = await get_orders_collection()
+    current = {
+        order["_id"]: order
+        async for order in orders.find({"_id": {"$in": [order_id for order_id, _ in changes]}}, BULK_FIELDS)
+    }
+
+    now = datetime.now(timezone.utc)
+    entry = {"at": now, "by": changed_by}
+    errors: Dict[ObjectId, str] = {}
+    planned: List[Tuple[dict, str]] = []
+    operations = []
+    for order_id, new_status in changes:
+        before = current.get(order_id)
+        if new_status not in ALLOWED_TRANSITIONS:
+            errors[order_id] = f"Invalid status. Must be one of: {ORDER_STATUSES}"
+        elif before is None:
+            errors[order_id] = "Order not found"
+        elif new_status not in ALLOWED_TRANSITIONS.get(before.get("status"), set()):
+            errors[order_id] = f"Order cannot go from '{before.get('status')}' to '{new_status}'"
+        else:
+            planned.append((before, new_status))
+            operations.append(UpdateOne(
+                {"_id": order_id, "status": before.get("status")},
+                {
+                    "$set": {"status": new_status, "updatedAt": now},
+                    "$push": {"statusHistory": {"status": new_status, **entry}}
+                }
+            ))
+    if not operations:
+        return errors
+
+    result = await orders.bulk_write(operations, ordered=False)
+    if result.matched_count < len(operations):
+        # Lost races: keep the orders that received this write's history entry
+        applied = {
+            order["_id"]
+            async for order in orders.find(
+                {"_id": {"$in": [before["_id"] for before, _ in planned]}, "statusHistory": {"$elemMatch": entry}},
+                {"_id": 1}
+            )
+        }
+        for before, _ in planned:
+            if before["_id"] not in applied:
+                errors[before["_id"]] = "Order was changed concurrently"
+        planned = [(before, new_status) for before, new_status in planned if before["_id"] in applied]
+
+    cancelled = [
+        before for before, new_status in planned
+        if new_status == "cancelled" and before.get("stockCommitted") is not False
+    ]
+    if cancelled:
+        await restore_stock(stock_lines(item for order in cancelled for item in order.get("items", [])))
+    await orders_status_changed(planned)
+    return errors
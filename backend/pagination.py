@@ -0,0 +1,74 @@
+"""Keyset (cursor) pagination helpers
+
+A cursor encodes the sort key and ``_id`` of the last document of a page, so
+the next page is an index range scan instead of an O(skip) walk.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pymongo import DESCENDING
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(document: dict, sort_field: str) -> str:
+    """Build the cursor pointing after ``document``"""
+    value = document.get(sort_field)
+    payload = {"id": str(document["_id"])}
+    if sort_field != "_id":
+        if isinstance(value, datetime):
+            payload["d"] = value.isoformat()
+        else:
+            payload["v"] = value
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort_field: str):
+    """Return the ``(value, ObjectId)`` pair stored in a cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        last_id = ObjectId(payload["id"])
+        if sort_field == "_id":
+            return last_id, last_id
+        if "d" in payload:
+            return datetime.fromisoformat(payload["d"]), last_id
+        return payload.get("v"), last_id
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def keyset_sort(sort_field: str, direction: int = DESCENDING) -> list:
+    """Sort specification matching the keyset filter"""
+    if sort_field == "_id":
+        return [("_id", direction)]
+    return [(sort_field, direction), ("_id", direction)]
+
+def apply_cursor(query: dict, cursor: Optional[str], sort_field: str, direction: int = DESCENDING) -> dict:
+    """Restrict ``query`` to the documents following ``cursor``"""
+    if not cursor:
+        return query
+
+    value, last_id = decode_cursor(cursor, sort_field)
+    op = "$lt" if direction == DESCENDING else "$gt"
+    if sort_field == "_id":
+        keyset = {"_id": {op: last_id}}
+    else:
+        keyset = {"$or": [
+            {sort_field: {op: value}},
+            {sort_field: value, "_id": {op: last_id}}
+        ]}
+
+    if not query:
+        return keyset
+    return {"$and": [query, keyset]}
+
+def next_cursor(results: list, limit: int, sort_field: str) -> Optional[str]:
+    """Cursor for the following page, or None when this page is the last one"""
+    if not results or len(results) < limit:
+        return None
+    return encode_cursor(results[-1], sort_field)
@@ -0,0 +1,172 @@
+"""Streaming bulk product import (NDJSON or CSV) with batched upserts"""
+import codecs
+import csv
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Tuple
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from models import ProductCreate
+from database import get_database
+from inventory import variants_in_stock
+from text_utils import slugify
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+# CSV cells holding lists use this separator, e.g. "Noir|Beige|Rouge"
+CSV_LIST_SEPARATOR = "|"
+CSV_LIST_FIELDS = ("colors", "sizes")
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream into lines without holding more than one chunk"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+async def iter_ndjson_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    """Yield ``(row_number, dict | error message)`` for each non-empty NDJSON line"""
+    row_number = 0
+    async for line in _iter_lines(chunks):
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, f"Invalid JSON: {e.msg}"
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    """Yield ``(row_number, dict)`` for each CSV record, the first line being the header"""
+    header = None
+    record = ""
+    row_number = 0
+    async for line in _iter_lines(chunks):
+        # A quoted cell may span lines: wait until the quotes are balanced
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue
+        text, record = record, ""
+        if not text.strip():
+            continue
+
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+
+        row_number += 1
+        row = {}
+        for name, value in zip(header, values):
+            value = value.strip()
+            if value == "":
+                continue
+            if name in CSV_LIST_FIELDS:
+                row[name] = [v.strip() for v in value.split(CSV_LIST_SEPARATOR) if v.strip()]
+            else:
+                row[name] = value
+        yield row_number, row
+
+def default_sku(name: str) -> str:
+    """SKU of products given none: imports match on it, so creates use it too"""
+    return slugify(name)
+
+def _upsert_operation(product: ProductCreate, now: datetime) -> UpdateOne:
+    fields = product.dict(exclude_none=True)
+    fields["sku"] = product.sku or default_sku(product.name)
+    fields["updatedAt"] = now
+    if fields.get("variants"):
+        fields["inStock"] = variants_in_stock(fields["variants"])
+    return UpdateOne(
+        {"sku": fields["sku"]},
+        {
+            "$set": fields,
+            "$setOnInsert": {"createdAt": now, "rating": 4.0, "reviews": 0}
+        },
+        upsert=True
+    )
+
+async def import_products(collection, rows: AsyncIterator[Tuple[int, object]]) -> dict:
+    """Validate rows as they arrive and upsert them by SKU in ``bulk_write`` batches"""
+    report = {"processed": 0, "inserted": 0, "updated": 0, "failed": 0, "errors": []}
+
+    def add_error(row_number: int, error):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": row_number, "error": error})
+
+    batch: List[UpdateOne] = []
+    batch_rows: List[int] = []
+
+    async def flush():
+        try:
+            result = await collection.bulk_write(batch, ordered=False)
+            report["inserted"] += result.upserted_count
+            report["updated"] += result.matched_count
+        except BulkWriteError as e:
+            details = e.details
+            report["inserted"] += details.get("nUpserted", 0)
+            report["updated"] += details.get("nMatched", 0)
+            for write_error in details.get("writeErrors", []):
+                add_error(batch_rows[write_error["index"]], write_error.get("errmsg", "Write failed"))
+        batch.clear()
+        batch_rows.clear()
+
+    now = datetime.now(timezone.utc)
+    async for row_number, row in rows:
+        report["processed"] += 1
+        if not isinstance(row, dict):
+            add_error(row_number, row if isinstance(row, str) else "Row must be an object")
+            continue
+        try:
+            product = ProductCreate(**row)
+        except ValidationError as e:
+            add_error(row_number, [
+                {"field": ".".join(str(part) for part in err["loc"]), "message": err["msg"]}
+                for err in e.errors()
+            ])
+            continue
+
+        batch.append(_upsert_operation(product, now))
+        batch_rows.append(row_number)
+        if len(batch) >= BATCH_SIZE:
+            await flush()
+
+    if batch:
+        await flush()
+
+    report["errorsTruncated"] = report["failed"] > len(report["errors"])
+    return report
+
+async def ensure_product_skus():
+    """Give products created without a SKU their default one, so imports update them"""
+    try:
+        database = await get_database()
+        taken = {
+            product["sku"]
+            async for product in database.products.find({"sku": {"$type": "string"}}, {"sku": 1})
+        }
+        operations = []
+        cursor = database.products.find({"sku": {"$not": {"$type": "string"}}}, {"name": 1}).sort("_id", 1)
+        async for product in cursor:
+            sku = default_sku(product.get("name") or "") or str(product["_id"])
+            if sku in taken:
+                # Same name as another product: the oldest one keeps the plain SKU
+                sku = f"{sku}-{product['_id']}"
+            taken.add(sku)
+            operations.append(UpdateOne({"_id": product["_id"]}, {"$set": {"sku": sku}}))
+            if len(operations) == BATCH_SIZE:
+                await database.products.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            await database.products.bulk_write(operations, ordered=False)
+    except Exception as e:
+        print(f"Error backfilling product SKUs: {e}")
@@ -0,0 +1,87 @@
+"""Sparse fieldsets: ``fields=`` / ``view=`` parameters pushed down as MongoDB projections"""
+from typing import Dict, Iterable, List, Optional
+from fastapi import HTTPException, status
+
+PRODUCT_FIELDS = {
+    "name", "category", "price", "originalPrice", "image", "description",
+    "colors", "sizes", "inStock", "variants", "rating", "reviews", "createdAt", "updatedAt"
+}
+PRODUCT_VIEWS: Dict[str, Optional[List[str]]] = {
+    # What a product grid tile shows
+    "card": ["name", "category", "price", "originalPrice", "image", "rating", "reviews", "inStock"],
+    "full": None
+}
+
+ORDER_FIELDS = {
+    "userId", "orderId", "items", "status", "statusHistory", "total", "subtotal", "shipping",
+    "shippingAddress", "paymentSessionId", "createdAt", "updatedAt"
+}
+ORDER_VIEWS: Dict[str, Optional[List[str]]] = {
+    "compact": ["orderId", "userId", "status", "total", "createdAt"],
+    "full": None
+}
+# Customer order history rows: stored fields plus values derived from the items
+ORDER_SUMMARY_VIEW = "summary"
+ORDER_SUMMARY_PROJECTION = {
+    "orderId": 1, "status": 1, "total": 1, "createdAt": 1, "updatedAt": 1,
+    "itemCount": {"$sum": "$items.quantity"},
+    "firstImage": {"$arrayElemAt": ["$items.image", 0]}
+}
+
+USER_FIELDS = {
+    "firstName", "lastName", "email", "role", "phone", "address", "avatar",
+    "joinDate", "isActive"
+}
+USER_VIEWS: Dict[str, Optional[List[str]]] = {
+    "compact": ["firstName", "lastName", "email", "role", "isActive"],
+    "full": None
+}
+
+class FieldSelection:
+    """Fields requested by the client plus the ones the server needs internally"""
+
+    def __init__(self, requested: Optional[List[str]], internal: Iterable[str] = ()):
+        self.requested = requested
+        self.internal = [f for f in internal if requested is not None and f not in requested]
+
+    @property
+    def key(self) -> Optional[tuple]:
+        """Hashable identity of the selection, for cache keys and ETag variants"""
+        return tuple(sorted(self.requested)) if self.requested is not None else None
+
+    def projection(self, exclude: Iterable[str] = ()) -> Optional[dict]:
+        """MongoDB projection for the selection (None means the whole document)"""
+        if self.requested is None:
+            excluded = {field: 0 for field in exclude}
+            return excluded or None
+        return {field: 1 for field in [*self.requested, *self.internal]}
+
+    def strip(self, documents: List[dict]) -> List[dict]:
+        """Remove the internal-only fields once the server is done with them"""
+        for document in documents:
+            for field in self.internal:
+                document.pop(field, None)
+        return documents
+
+def select_fields(fields: Optional[str], view: Optional[str], allowed: set,
+                  views: Dict[str, Optional[List[str]]], internal: Iterable[str] = ()) -> FieldSelection:
+    """Resolve ``fields=a,b`` (takes precedence) or ``view=name`` into a selection"""
+    if fields:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = sorted(set(requested) - allowed)
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(unknown)}"
+            )
+        return FieldSelection(list(dict.fromkeys(requested)), internal)
+
+    if view:
+        if view not in views:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid view. Must be one of: {list(views)}"
+            )
+        return FieldSelection(views[view], internal)
+
+    return FieldSelection(None)
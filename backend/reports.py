@@ -0,0 +1,221 @@
+"""Customer cohort retention and lifetime value reports
+
+Orders are streamed out of MongoDB in batches into columnar NumPy arrays;
+customers are turned into dense integer codes (pandas hashing) and every
+aggregation is a vectorized sort or bincount, run off the event loop. The
+result is cached and refreshed on a schedule, since it is a full scan.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from database import get_database
+
+logger = logging.getLogger(__name__)
+
+FETCH_BATCH_SIZE = 10000
+REPORT_REFRESH_SECONDS = int(os.environ.get("REPORT_REFRESH_SECONDS", str(6 * 3600)))
+
+_report: Optional[dict] = None
+_report_started: Optional[datetime] = None
+_refresh_lock = asyncio.Lock()
+_refresher: Optional[asyncio.Task] = None
+
+class _Columns:
+    """Growable column store: one list of array chunks per field"""
+
+    def __init__(self):
+        self.user = []
+        self.created = []
+        self.total = []
+
+    def add(self, batch: List[dict]):
+        self.user.append(np.array([order["userId"].binary for order in batch], dtype="S12"))
+        self.created.append(np.array([order["createdAt"] for order in batch], dtype="datetime64[ms]"))
+        self.total.append(np.array([order.get("total") or 0 for order in batch], dtype="float64"))
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        # Kept as plain arrays: pandas would box the S12 ids into Python objects
+        return {
+            "user": np.concatenate(self.user) if self.user else np.array([], dtype="S12"),
+            "created": np.concatenate(self.created) if self.created else np.array([], dtype="datetime64[ms]"),
+            "total": np.concatenate(self.total) if self.total else np.array([], dtype="float64")
+        }
+
+async def _load_orders() -> Dict[str, np.ndarray]:
+    """Non-cancelled customer orders of the hot and archive collections"""
+    database = await get_database()
+    query = {"userId": {"$type": "objectId"}, "createdAt": {"$type": "date"}, "status": {"$ne": "cancelled"}}
+    fields = {"_id": 0, "userId": 1, "createdAt": 1, "total": 1}
+    columns = _Columns()
+    for collection in (database.orders, database.orders_archive):
+        cursor = collection.find(query, fields, batch_size=FETCH_BATCH_SIZE)
+        batch = []
+        async for order in cursor:
+            batch.append(order)
+            if len(batch) == FETCH_BATCH_SIZE:
+                columns.add(batch)
+                batch = []
+        if batch:
+            columns.add(batch)
+    return columns.arrays()
+
+async def _load_users() -> Dict[str, np.ndarray]:
+    database = await get_database()
+    users, joined = [], []
+    cursor = database.users.find({"role": {"$ne": "admin"}}, {"joinDate": 1}, batch_size=FETCH_BATCH_SIZE)
+    async for user in cursor:
+        users.append(user["_id"].binary)
+        # Self-registered accounts have no join date: their id tells when they were created
+        joined.append(user.get("joinDate") or user["_id"].generation_time.replace(tzinfo=None))
+    return {
+        "user": np.array(users, dtype="S12"),
+        "joined": np.array(joined, dtype="datetime64[ms]")
+    }
+
+def _month_index(values: np.ndarray) -> np.ndarray:
+    """Months since 1970-01 (NaT becomes -1)"""
+    months = values.astype("datetime64[M]")
+    return np.where(np.isnat(months), -1, months.astype("int64"))
+
+def _month_label(month: int) -> str:
+    return f"{1970 + month // 12}-{month % 12 + 1:02d}"
+
+def _first_order_cohorts(user: np.ndarray, month: np.ndarray) -> List[dict]:
+    """Share of each first-order cohort ordering again N months later"""
+    if not len(user):
+        return []
+    first = np.full(user.max() + 1, np.iinfo(np.int64).max)
+    np.minimum.at(first, user, month)
+    cohort = first[user]
+    offset = month - cohort
+
+    # One entry per (customer, active month), packed in one integer key
+    span = int(offset.max()) + 1
+    keys = np.sort(user * span + offset)
+    active = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+    active_user, active_offset = np.divmod(active, span)
+
+    cohorts, cohort_index = np.unique(first[active_user], return_inverse=True)
+    counts = np.bincount(cohort_index * span + active_offset, minlength=len(cohorts) * span).reshape(-1, span)
+    sizes = counts[:, 0]
+    retention = np.round(counts / sizes[:, None], 4)
+    return [
+        {"cohort": _month_label(int(cohort)), "customers": int(size), "retention": row.tolist()}
+        for cohort, size, row in zip(cohorts, sizes, retention)
+    ]
+
+def _signup_ltv(user: np.ndarray, created: np.ndarray, month: np.ndarray, total: np.ndarray,
+                signed_up: np.ndarray, joined: np.ndarray) -> List[dict]:
+    """Revenue per signed-up customer, cumulated by months since signup"""
+    join_month = _month_index(joined)
+    known = join_month >= 0
+    if not known.any():
+        return []
+    signed_up, joined, join_month = signed_up[known], joined[known], join_month[known]
+    cohorts, sizes = np.unique(join_month, return_counts=True)
+
+    # Per-customer signup data, indexed by the order rows' customer codes
+    size = max(int(user.max()) + 1 if len(user) else 0, int(signed_up.max()) + 1)
+    customer_month = np.full(size, -1)
+    customer_day = np.full(size, np.datetime64("NaT"), dtype="datetime64[D]")
+    customer_month[signed_up] = join_month
+    customer_day[signed_up] = joined.astype("datetime64[D]")
+
+    order_month = customer_month[user]
+    keep = (order_month >= 0) & (created.astype("datetime64[D]") >= customer_day[user])
+    cohort_index = np.searchsorted(cohorts, order_month[keep])
+    offset = month[keep] - order_month[keep]
+    span = int(offset.max()) + 1 if len(offset) else 0
+    revenue = np.bincount(
+        cohort_index * span + offset, weights=total[keep], minlength=len(cohorts) * span
+    ).reshape(len(cohorts), span)
+    cumulative = np.round(np.cumsum(revenue, axis=1) / sizes[:, None], 2)
+    totals = revenue.sum(axis=1)
+
+    # A customer belongs to one cohort: count the distinct ones with orders
+    buyer_codes = np.flatnonzero(np.bincount(user[keep], minlength=size))
+    buyers = np.bincount(np.searchsorted(cohorts, customer_month[buyer_codes]), minlength=len(cohorts))
+
+    return [
+        {
+            "cohort": _month_label(int(cohort)),
+            "customers": int(customers),
+            "buyers": int(buyer_count),
+            "revenue": round(float(revenue_total), 2),
+            "ltv": round(float(revenue_total) / int(customers), 2),
+            "cumulativeLtv": row.tolist()
+        }
+        for cohort, customers, buyer_count, revenue_total, row in zip(cohorts, sizes, buyers, totals, cumulative)
+    ]
+
+def _customer_codes(ids: np.ndarray) -> np.ndarray:
+    """Dense integer codes for 12-byte ObjectIds (hashing integers, not bytes)"""
+    parts = np.frombuffer(np.ascontiguousarray(ids, dtype="S12").tobytes(), dtype=[("hi", "u8"), ("lo", "u4")])
+    high, _ = pd.factorize(parts["hi"])
+    low, _ = pd.factorize(parts["lo"])
+    codes, _ = pd.factorize(high.astype("int64") * (int(low.max(initial=0)) + 1) + low)
+    return codes
+
+def compute_report(orders: Dict[str, np.ndarray], users: Dict[str, np.ndarray]) -> dict:
+    """Pure, CPU-bound part of the report (runs in a worker thread)"""
+    # Integer customer codes shared by orders and users
+    codes = _customer_codes(np.concatenate([orders["user"], users["user"]]))
+    user, signed_up = codes[:len(orders["user"])], codes[len(orders["user"]):]
+    month = _month_index(orders["created"])
+    return {
+        "orders": int(len(user)),
+        "customers": int(np.count_nonzero(np.bincount(user))) if len(user) else 0,
+        "firstOrderCohorts": _first_order_cohorts(user, month),
+        "signupCohorts": _signup_ltv(user, orders["created"], month, orders["total"], signed_up, users["joined"])
+    }
+
+async def refresh_report() -> dict:
+    """Recompute the report (concurrent callers share one computation)"""
+    global _report, _report_started
+    requested = datetime.now(timezone.utc)
+    async with _refresh_lock:
+        # A computation started while this caller waited already covers it
+        if _report is not None and _report_started >= requested:
+            return _report
+        started = datetime.now(timezone.utc)
+        orders = await _load_orders()
+        users = await _load_users()
+        report = await asyncio.to_thread(compute_report, orders, users)
+        report["generatedAt"] = datetime.now(timezone.utc)
+        report["durationSeconds"] = round((report["generatedAt"] - started).total_seconds(), 3)
+        _report, _report_started = report, started
+        return report
+
+async def get_report(refresh: bool = False) -> dict:
+    """Cached report; computed on first use"""
+    if refresh or _report is None:
+        return await refresh_report()
+    return _report
+
+async def _refresh_periodically():
+    # The first report is computed on demand, not by every worker at startup
+    while True:
+        await asyncio.sleep(REPORT_REFRESH_SECONDS)
+        try:
+            await refresh_report()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error refreshing customer reports: {e}")
+
+def start_report_refresher():
+    """Start the refresh schedule (called from the startup hook)"""
+    global _refresher
+    _refresher = asyncio.create_task(_refresh_periodically())
+
+async def stop_report_refresher():
+    """Cancel the refresh schedule (called from the shutdown hook)"""
+    global _refresher
+    if _refresher:
+        _refresher.cancel()
+        await asyncio.gather(_refresher, return_exceptions=True)
+        _refresher = None
@@ -0,0 +1,146 @@
+"""Stock holds taken for the lifetime of a checkout session
+
+A hold decrements the variant counters up front (see ``inventory``), so the
+counters always show what is still sellable. Paying commits the hold; an
+abandoned or expired checkout gives the stock back through the sweeper.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from database import get_stock_reservations_collection
+from inventory import InsufficientStock, decrement_stock, restore_stock, tracked_product_ids
+
+logger = logging.getLogger(__name__)
+
+# Stripe accepts checkout sessions expiring 30 minutes to 24 hours after
+# their creation; one extra minute covers the time until the Stripe call lands
+HOLD_MINUTES = max(31, int(os.environ.get("CHECKOUT_HOLD_MINUTES", "31")))
+# Holds outlive their session slightly so a last-second payment still finds them
+HOLD_GRACE = timedelta(minutes=5)
+SWEEP_INTERVAL_SECONDS = 60
+SWEEP_BATCH_SIZE = 100
+
+_sweeper: Optional[asyncio.Task] = None
+
+def hold_expiry(now: Optional[datetime] = None) -> datetime:
+    """When a checkout session created ``now`` expires, rounded up to the second"""
+    expires_at = (now or datetime.now(timezone.utc)) + timedelta(minutes=HOLD_MINUTES)
+    if expires_at.microsecond:
+        expires_at = expires_at.replace(microsecond=0) + timedelta(seconds=1)
+    return expires_at
+
+async def hold_stock(lines: List[dict]) -> ObjectId:
+    """Take the stock of a checkout; raises ``InsufficientStock`` if it is not available.
+
+    The hold expires with a session created now until ``attach_session``
+    records the expiry of the actual one.
+    """
+    tracked = await tracked_product_ids(line["productId"] for line in lines)
+    lines = [line for line in lines if line["productId"] in tracked]
+    await decrement_stock(lines, tracked)
+
+    reservations = await get_stock_reservations_collection()
+    now = datetime.now(timezone.utc)
+    result = await reservations.insert_one({
+        "lines": lines,
+        "status": "held",
+        "sessionId": None,
+        "expiresAt": hold_expiry() + HOLD_GRACE,
+        "createdAt": now,
+        "closedAt": None
+    })
+    return result.inserted_id
+
+async def attach_session(reservation_id: ObjectId, session_id: str, session_expires_at: datetime):
+    reservations = await get_stock_reservations_collection()
+    await reservations.update_one(
+        {"_id": reservation_id},
+        {"$set": {"sessionId": session_id, "expiresAt": session_expires_at + HOLD_GRACE}}
+    )
+
+async def _close(reservation_id: ObjectId, new_status: str) -> Optional[dict]:
+    """Move a hold out of "held"; only one caller can win"""
+    reservations = await get_stock_reservations_collection()
+    return await reservations.find_one_and_update(
+        {"_id": reservation_id, "status": "held"},
+        {"$set": {"status": new_status, "closedAt": datetime.now(timezone.utc)}},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def release_hold(reservation_id: ObjectId) -> bool:
+    """Give the stock of an unpaid checkout back"""
+    reservation = await _close(reservation_id, "released")
+    if not reservation:
+        return False
+    await restore_stock(reservation["lines"])
+    return True
+
+async def release_session_hold(session_id: str) -> bool:
+    """Release the hold of a checkout session reported as expired"""
+    reservations = await get_stock_reservations_collection()
+    reservation = await reservations.find_one({"sessionId": session_id, "status": "held"}, {"_id": 1})
+    return bool(reservation) and await release_hold(reservation["_id"])
+
+async def commit_hold(reservation_id: Optional[ObjectId], lines: List[dict]) -> bool:
+    """Turn the hold of a paid checkout into a sale.
+
+    If the hold is gone (released after expiry, or a checkout created before
+    holds existed) the stock is taken now; returns False when it no longer is
+    available, the order then needs manual follow-up.
+    """
+    if reservation_id:
+        if await _close(reservation_id, "committed"):
+            return True
+        # Replayed payment notifications must not take the stock twice
+        reservations = await get_stock_reservations_collection()
+        reservation = await reservations.find_one({"_id": reservation_id}, {"status": 1})
+        if reservation and reservation["status"] == "committed":
+            return True
+    try:
+        await decrement_stock(lines)
+        return True
+    except InsufficientStock:
+        return False
+
+async def release_expired_holds() -> int:
+    """Release every hold past its expiry (one index range scan per batch)"""
+    reservations = await get_stock_reservations_collection()
+    released = 0
+    while True:
+        expired = await reservations.find(
+            {"status": "held", "expiresAt": {"$lt": datetime.now(timezone.utc)}},
+            {"_id": 1}
+        ).limit(SWEEP_BATCH_SIZE).to_list(length=SWEEP_BATCH_SIZE)
+        for reservation in expired:
+            released += await release_hold(reservation["_id"])
+        if len(expired) < SWEEP_BATCH_SIZE:
+            return released
+
+async def _sweep():
+    while True:
+        try:
+            released = await release_expired_holds()
+            if released:
+                logger.info(f"Released {released} expired stock holds")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error releasing expired stock holds: {e}")
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+
+def start_reservation_sweeper():
+    """Start the expired-hold sweeper (called from the startup hook)"""
+    global _sweeper
+    _sweeper = asyncio.create_task(_sweep())
+
+async def stop_reservation_sweeper():
+    """Cancel the sweeper (called from the shutdown hook)"""
+    global _sweeper
+    if _sweeper:
+        _sweeper.cancel()
+        await asyncio.gather(_sweeper, return_exceptions=True)
+        _sweeper = None
@@ -0,0 +1,284 @@
+"""Hourly and daily order rollups for the admin analytics
+
+Every order is counted in the hour and the day (UTC) it was created. A
+rollup document holds the non-cancelled orders of its period (count,
+revenue, subtotal, shipping, units, revenue and units by category) plus the
+cancelled ones apart, so a date range is answered by summing a few small
+documents instead of scanning the orders.
+
+Live writes ``$inc`` the rollups. A rebuild writes absolute values into a
+scratch collection renamed over the live one, behind a lock document in
+``locks``; while it runs, order hooks only mark the buckets they touch and
+those are recounted from the orders once the new rollups are in place.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+from bson import ObjectId
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from database import get_database
+
+GRANULARITIES = {"hour": "h", "day": "d"}
+GRANULARITY_STEPS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+REBUILD_LOCK_ID = "order_rollups"
+# Renewed while the rebuild scans; an interrupted rebuild frees it this soon
+REBUILD_LEASE = timedelta(minutes=2)
+REBUILD_COLLECTION = "order_rollups_rebuild"
+SCAN_BATCH_SIZE = 10000
+INSERT_BATCH_SIZE = 1000
+
+def _utc(value: datetime) -> datetime:
+    # MongoDB hands back naive UTC datetimes
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+def period_start(moment: datetime, granularity: str) -> datetime:
+    moment = _utc(moment).replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if granularity == "day" else moment
+
+def rollup_id(start: datetime, granularity: str) -> str:
+    # Ids sort chronologically within a granularity, so ranges are _id scans
+    return f"{GRANULARITIES[granularity]}:{start.strftime('%Y-%m-%dT%H')}"
+
+def _category_key(category: Optional[str]) -> str:
+    return (category or "unknown").replace(".", "_")
+
+def order_counters(order: dict, sign: int = 1) -> Counter:
+    """Rollup changes for adding (sign=1) or removing (sign=-1) one order"""
+    total = order.get("total") or 0
+    if order.get("status") == "cancelled":
+        return Counter({"cancelledOrders": sign, "cancelledRevenue": sign * total})
+
+    counters = Counter({
+        "orders": sign,
+        "revenue": sign * total,
+        "subtotal": sign * (order.get("subtotal") or 0),
+        "shipping": sign * (order.get("shipping") or 0)
+    })
+    for item in order.get("items", []):
+        quantity = item.get("quantity") or 0
+        category = _category_key(item.get("category"))
+        counters["units"] += sign * quantity
+        counters[f"byCategory.{category}.units"] += sign * quantity
+        counters[f"byCategory.{category}.revenue"] += sign * quantity * (item.get("price") or 0)
+    return counters
+
+def _accumulate(buckets: Dict[str, dict], order: dict, counters: Counter):
+    for granularity in GRANULARITIES:
+        start = period_start(order["createdAt"], granularity)
+        bucket = buckets.setdefault(rollup_id(start, granularity), {
+            "granularity": granularity,
+            "start": start,
+            "counters": Counter()
+        })
+        bucket["counters"].update(counters)
+
+async def _write(buckets: Dict[str, dict]):
+    operations = []
+    for bucket_id, bucket in buckets.items():
+        counters = {field: value for field, value in bucket["counters"].items() if value}
+        if counters:
+            operations.append(UpdateOne(
+                {"_id": bucket_id},
+                {"$inc": counters, "$setOnInsert": {"granularity": bucket["granularity"], "start": bucket["start"]}},
+                upsert=True
+            ))
+    if operations:
+        database = await get_database()
+        await database.order_rollups.bulk_write(operations, ordered=False)
+
+async def apply_order_changes(changes: Iterable[tuple]):
+    """Apply (order before or None, order after or None) pairs in one bulk write"""
+    buckets: Dict[str, dict] = {}
+    for before, after in changes:
+        for order, sign in ((before, -1), (after, 1)):
+            if order and order.get("createdAt"):
+                _accumulate(buckets, order, order_counters(order, sign))
+    if not buckets:
+        return
+
+    # During a rebuild the buckets are recounted afterwards instead
+    database = await get_database()
+    marked = await database.locks.update_one(
+        {"_id": REBUILD_LOCK_ID, "expiresAt": {"$gt": datetime.now(timezone.utc)}},
+        {"$addToSet": {"dirty": {"$each": list(buckets)}}}
+    )
+    if not marked.matched_count:
+        await _write(buckets)
+
+def _nested(counters: Counter) -> dict:
+    """Dotted counter names as the nested fields ``$inc`` would have created"""
+    document: dict = {}
+    for field, value in counters.items():
+        if value:
+            *path, leaf = field.split(".")
+            target = document
+            for part in path:
+                target = target.setdefault(part, {})
+            target[leaf] = value
+    return document
+
+def _rollup_document(bucket_id: str, bucket: dict) -> dict:
+    return {"_id": bucket_id, "granularity": bucket["granularity"], "start": bucket["start"], **_nested(bucket["counters"])}
+
+async def _product_categories(database) -> dict:
+    return {
+        product["_id"]: product.get("category")
+        async for product in database.products.find({}, {"category": 1})
+    }
+
+async def _scan(database, query: dict, categories: dict, renew_lease: bool = False) -> Dict[str, dict]:
+    """Rollups of the orders and archived orders matching ``query``"""
+    fields = {"createdAt": 1, "status": 1, "total": 1, "subtotal": 1, "shipping": 1, "items": 1}
+
+    buckets: Dict[str, dict] = {}
+    scanned = 0
+    for collection in (database.orders, database.orders_archive):
+        async for order in collection.find(query, fields, batch_size=SCAN_BATCH_SIZE):
+            # Orders placed before items carried their category
+            for item in order.get("items", []):
+                if not item.get("category") and ObjectId.is_valid(item.get("productId") or ""):
+                    item["category"] = categories.get(ObjectId(item["productId"]))
+            _accumulate(buckets, order, order_counters(order))
+            scanned += 1
+            if renew_lease and scanned % SCAN_BATCH_SIZE == 0:
+                await _renew_lock(database)
+    return buckets
+
+async def _acquire_lock(database) -> bool:
+    now = datetime.now(timezone.utc)
+    try:
+        await database.locks.insert_one({"_id": REBUILD_LOCK_ID, "expiresAt": now + REBUILD_LEASE, "dirty": []})
+        return True
+    except DuplicateKeyError:
+        # Taken over only from a rebuild that stopped renewing its lease
+        taken = await database.locks.find_one_and_update(
+            {"_id": REBUILD_LOCK_ID, "expiresAt": {"$lte": now}},
+            {"$set": {"expiresAt": now + REBUILD_LEASE, "dirty": []}}
+        )
+        return taken is not None
+
+async def _renew_lock(database):
+    await database.locks.update_one(
+        {"_id": REBUILD_LOCK_ID},
+        {"$set": {"expiresAt": datetime.now(timezone.utc) + REBUILD_LEASE}}
+    )
+
+async def _recount(database, bucket_ids: List[str]):
+    """Replace buckets by absolute values counted from the orders of their period"""
+    categories = await _product_categories(database)
+    operations = []
+    for bucket_id in bucket_ids:
+        granularity = next(name for name, prefix in GRANULARITIES.items() if bucket_id.startswith(f"{prefix}:"))
+        start = datetime.strptime(bucket_id[2:], "%Y-%m-%dT%H").replace(tzinfo=timezone.utc)
+        period = {"$gte": start, "$lt": start + GRANULARITY_STEPS[granularity]}
+        buckets = await _scan(database, {"createdAt": period}, categories)
+        if bucket_id in buckets:
+            operations.append(ReplaceOne({"_id": bucket_id}, _rollup_document(bucket_id, buckets[bucket_id]), upsert=True))
+        else:
+            operations.append(DeleteOne({"_id": bucket_id}))
+    if operations:
+        await database.order_rollups.bulk_write(operations, ordered=False)
+
+async def _release_lock(database):
+    """Recount the buckets marked during the rebuild, then let hooks write again"""
+    while True:
+        lock = await database.locks.find_one_and_update(
+            {"_id": REBUILD_LOCK_ID},
+            {"$set": {"dirty": [], "expiresAt": datetime.now(timezone.utc) + REBUILD_LEASE}}
+        )
+        if lock is None:
+            return
+        if lock.get("dirty"):
+            await _recount(database, lock["dirty"])
+            continue
+        # Only released if no hook marked a bucket since the last recount
+        released = await database.locks.delete_one({"_id": REBUILD_LOCK_ID, "dirty": {"$size": 0}})
+        if released.deleted_count:
+            return
+
+async def rebuild_rollups() -> bool:
+    """Recompute every rollup from the orders and the archive (full scan).
+
+    Returns False without doing anything when another rebuild is running.
+    """
+    database = await get_database()
+    if not await _acquire_lock(database):
+        return False
+    try:
+        categories = await _product_categories(database)
+        buckets = await _scan(database, {"createdAt": {"$type": "date"}}, categories, renew_lease=True)
+        documents = [_rollup_document(bucket_id, bucket) for bucket_id, bucket in buckets.items()]
+        scratch = database[REBUILD_COLLECTION]
+        await scratch.drop()
+        for index in range(0, len(documents), INSERT_BATCH_SIZE):
+            await scratch.insert_many(documents[index:index + INSERT_BATCH_SIZE])
+            await _renew_lock(database)
+        if documents:
+            await scratch.rename("order_rollups", dropTarget=True)
+        else:
+            await database.order_rollups.delete_many({})
+    finally:
+        await _release_lock(database)
+    return True
+
+async def ensure_rollups():
+    """Build the rollups on first start, or redo a rebuild that was interrupted"""
+    try:
+        database = await get_database()
+        interrupted = await database.locks.find_one(
+            {"_id": REBUILD_LOCK_ID, "expiresAt": {"$lte": datetime.now(timezone.utc)}}
+        )
+        if interrupted or not await database.order_rollups.find_one({}, {"_id": 1}):
+            await rebuild_rollups()
+    except Exception as e:
+        print(f"Error building order rollups: {e}")
+
+def _summary(counters: dict) -> dict:
+    orders = counters.get("orders", 0)
+    revenue = counters.get("revenue", 0)
+    return {
+        "orders": orders,
+        "revenue": round(revenue, 2),
+        "averageBasket": round(revenue / orders, 2) if orders else 0,
+        "subtotal": round(counters.get("subtotal", 0), 2),
+        "shipping": round(counters.get("shipping", 0), 2),
+        "units": counters.get("units", 0),
+        "cancelledOrders": counters.get("cancelledOrders", 0),
+        "cancelledRevenue": round(counters.get("cancelledRevenue", 0), 2),
+        "byCategory": {
+            category: {"units": values.get("units", 0), "revenue": round(values.get("revenue", 0), 2)}
+            for category, values in counters.get("byCategory", {}).items()
+        }
+    }
+
+async def order_series(start: datetime, end: datetime, granularity: str) -> dict:
+    """Rollups of [start, end) plus their totals"""
+    database = await get_database()
+    first = period_start(start, granularity)
+    last = period_start(end, granularity)
+    if last < _utc(end):
+        # The period holding ``end`` is partly in range
+        last += GRANULARITY_STEPS[granularity]
+    rows = await database.order_rollups.find({
+        "_id": {"$gte": rollup_id(first, granularity), "$lt": rollup_id(last, granularity)}
+    }).sort("_id", 1).to_list(length=None)
+
+    totals: Counter = Counter()
+    by_category: Dict[str, Counter] = defaultdict(Counter)
+    series: List[dict] = []
+    for row in rows:
+        for field in ("orders", "revenue", "subtotal", "shipping", "units", "cancelledOrders", "cancelledRevenue"):
+            totals[field] += row.get(field, 0)
+        for category, values in row.get("byCategory", {}).items():
+            by_category[category].update(values)
+        series.append({"start": row["start"], **_summary(row)})
+
+    return {
+        "granularity": granularity,
+        "start": first,
+        "end": last,
+        "series": series,
+        "totals": _summary({**totals, "byCategory": by_category})
+    }
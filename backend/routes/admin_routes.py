@@ -1,39 +1,57 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
 from typing import List, Optional
-from models import User, UserCreate, UserUpdate, UserResponse, Order
+from models import User, UserCreate, UserUpdate, UserResponse, Order, OrderStatusUpdate, BulkOrderStatusUpdate
 from auth import get_current_admin_user, get_password_hash, user_to_response
 from database import get_users_collection, get_orders_collection
+from pagination import NEXT_CURSOR_HEADER, apply_cursor, keyset_sort, next_cursor
+from cache import cache_stats, user_cache
+from projections import ORDER_FIELDS, ORDER_VIEWS, USER_FIELDS, USER_VIEWS, select_fields
+from order_status import ORDER_STATUSES, transition_order, transition_orders
+from order_events import orders_deleted
+from stats import get_stats, record_stats
+from rollups import GRANULARITY_STEPS, order_series
+from reports import get_report
+from user_search import search_keys, search_query, with_search_keys
 from bson import ObjectId
-from datetime import datetime, timezone
+from pymongo import ASCENDING, DESCENDING
+from datetime import datetime, timedelta, timezone
 
 router = APIRouter()
 
+# Two years of days, or a month of hours
+MAX_ANALYTICS_PERIODS = 750
+
 # User Management
 @router.get("/users", response_model=List[dict])
 async def get_all_users(
+    response: Response,
     search: Optional[str] = Query(None, max_length=200),
     skip: int = Query(0, ge=0),
-    limit: int = Query(100, le=100),
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, max_length=200),
+    fields: Optional[str] = Query(None, max_length=500),
+    view: Optional[str] = Query(None, max_length=20),
     current_admin: UserResponse = Depends(get_current_admin_user)
 ):
     """Get all users (admin only)"""
     users = await get_users_collection()
+    projection = select_fields(fields, view, USER_FIELDS, USER_VIEWS).projection(exclude=["password", "searchKeys"])
     
     # Build query with sanitized input
-    query = {}
-    if search:
-        # Sanitize search - escape special regex characters
-        import re
-        sanitized_search = re.escape(search)
-        query["$or"] = [
-            {"firstName": {"$regex": sanitized_search, "$options": "i"}},
-            {"lastName": {"$regex": sanitized_search, "$options": "i"}},
-            {"email": {"$regex": sanitized_search, "$options": "i"}}
-        ]
-    
-    # Execute query
-    cursor = users.find(query, {"password": 0}).skip(skip).limit(limit)
-    results = await cursor.to_list(length=limit)
+    # Prefix match on the indexed search keys (accent and case insensitive)
+    query = search_query(search) if search else {}
+    
+    # Execute query - newest first, paged by cursor when given, else by skip
+    if cursor:
+        db_cursor = users.find(apply_cursor(query, cursor, "_id"), projection)
+    else:
+        db_cursor = users.find(query, projection).skip(skip)
+    db_cursor = db_cursor.sort(keyset_sort("_id")).limit(limit)
+    results = await db_cursor.to_list(length=limit)
+    
+    token = next_cursor(results, limit, "_id")
+    if token:
+        response.headers[NEXT_CURSOR_HEADER] = token
     
     # Convert ObjectId to string
     for user in results:
@@ -65,11 +83,13 @@ async def create_user(
     user_dict["avatar"] = "https://images.unsplash.com/photo-1472099645785-5658abf4ff4e?w=100&h=100&fit=crop&crop=face"
     user_dict["joinDate"] = datetime.now(timezone.utc)
     user_dict["isActive"] = True
+    user_dict["searchKeys"] = search_keys(user_dict)
     
     result = await users.insert_one(user_dict)
+    await record_stats({"users": 1})
     
     # Return created user (without password)
-    created_user = await users.find_one({"_id": result.inserted_id}, {"password": 0})
+    created_user = await users.find_one({"_id": result.inserted_id}, {"password": 0, "searchKeys": 0})
     created_user["id"] = str(created_user["_id"])
     del created_user["_id"]
     
@@ -121,11 +141,12 @@ async def update_user(
     if update_data:
         await users.update_one(
             {"_id": user_obj_id},
-            {"$set": update_data}
+            {"$set": with_search_keys(update_data, existing_user)}
         )
+        user_cache.delete(user_id)
     
     # Return updated user (without password)
-    updated_user = await users.find_one({"_id": user_obj_id}, {"password": 0})
+    updated_user = await users.find_one({"_id": user_obj_id}, {"password": 0, "searchKeys": 0})
     updated_user["id"] = str(updated_user["_id"])
     del updated_user["_id"]
     
@@ -169,43 +190,166 @@ async def delete_user(
             detail="User not found"
         )
     
+    user_cache.delete(user_id)
+    await record_stats({"users": -1})
     return {"message": "User deleted successfully"}
 
 # Order Management
+async def _order_filters(statuses: Optional[str], start: Optional[datetime], end: Optional[datetime],
+                         customer: Optional[str], min_total: Optional[float],
+                         max_total: Optional[float]) -> Optional[dict]:
+    """MongoDB filter for the admin order queue (None when it cannot match)"""
+    query = {}
+    if statuses:
+        wanted = sorted({value.strip() for value in statuses.split(",") if value.strip()})
+        unknown = [value for value in wanted if value not in ORDER_STATUSES]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid status {unknown}. Must be one of: {ORDER_STATUSES}"
+            )
+        query["status"] = wanted[0] if len(wanted) == 1 else {"$in": wanted}
+
+    if start or end:
+        query["createdAt"] = {}
+        if start:
+            query["createdAt"]["$gte"] = start
+        if end:
+            query["createdAt"]["$lt"] = end
+
+    if customer:
+        # A user id, or the email of the account
+        if ObjectId.is_valid(customer):
+            query["userId"] = ObjectId(customer)
+        else:
+            users = await get_users_collection()
+            user = await users.find_one({"email": customer.strip()}, {"_id": 1})
+            if not user:
+                return None
+            query["userId"] = user["_id"]
+
+    if min_total is not None or max_total is not None:
+        query["total"] = {}
+        if min_total is not None:
+            query["total"]["$gte"] = min_total
+        if max_total is not None:
+            query["total"]["$lte"] = max_total
+    return query
+
+@router.get("/orders/counts")
+async def get_order_counts(current_admin: UserResponse = Depends(get_current_admin_user)):
+    """Orders per status, read from the dashboard counters (admin only)"""
+    stats = await get_stats()
+    counts = stats.get("ordersByStatus", {})
+    return {
+        "ordersByStatus": {order_status: counts.get(order_status, 0) for order_status in ORDER_STATUSES},
+        "updatedAt": stats.get("updatedAt")
+    }
+
 @router.get("/orders", response_model=List[dict])
 async def get_all_orders(
+    response: Response,
+    order_status: Optional[str] = Query(None, alias="status", max_length=200),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    customer: Optional[str] = Query(None, max_length=200),
+    min_total: Optional[float] = Query(None, ge=0),
+    max_total: Optional[float] = Query(None, ge=0),
+    sort: str = Query("desc", pattern="^(asc|desc)$"),
     skip: int = Query(0, ge=0),
-    limit: int = Query(100, le=100),
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, max_length=200),
+    fields: Optional[str] = Query(None, max_length=500),
+    view: Optional[str] = Query(None, max_length=20),
     current_admin: UserResponse = Depends(get_current_admin_user)
 ):
-    """Get all orders (admin only)"""
+    """Get orders, optionally filtered, by creation date (admin only)
+
+    ``status`` takes a comma-separated list, e.g. ``status=paid,processing&sort=asc``
+    for the fulfillment queue oldest first; ``start``/``end`` bound ``createdAt``.
+    """
     orders = await get_orders_collection()
-    
-    cursor = orders.find().skip(skip).limit(limit).sort("createdAt", -1)
-    results = await cursor.to_list(length=limit)
+    selection = select_fields(fields, view, ORDER_FIELDS, ORDER_VIEWS, internal=("createdAt",))
+    projection = selection.projection()
+    
+    query = await _order_filters(order_status, start, end, customer, min_total, max_total)
+    if query is None:
+        return []
+    
+    # Paged by cursor when given, else by skip; (status, createdAt, _id) and
+    # (userId, createdAt, _id) serve the filtered sorts, total is a residual filter
+    direction = ASCENDING if sort == "asc" else DESCENDING
+    if cursor:
+        db_cursor = orders.find(apply_cursor(query, cursor, "createdAt", direction), projection)
+    else:
+        db_cursor = orders.find(query, projection).skip(skip)
+    db_cursor = db_cursor.sort(keyset_sort("createdAt", direction)).limit(limit)
+    results = await db_cursor.to_list(length=limit)
+    
+    token = next_cursor(results, limit, "createdAt")
+    if token:
+        response.headers[NEXT_CURSOR_HEADER] = token
+    selection.strip(results)
     
     # Convert ObjectId to string
     for order in results:
         order["id"] = str(order["_id"])
-        order["userId"] = str(order["userId"])
+        if "userId" in order:
+            order["userId"] = str(order["userId"])
         del order["_id"]
     
     return results
 
+@router.put("/orders/status")
+async def update_order_statuses(
+    bulk_update: BulkOrderStatusUpdate,
+    current_admin: UserResponse = Depends(get_current_admin_user)
+):
+    """Update the status of many orders at once (admin only); one result per order"""
+    order_ids = [update.orderId for update in bulk_update.updates]
+    # "5FAB..." and "5fab..." are the same order
+    distinct = {ObjectId(order_id) if ObjectId.is_valid(order_id) else order_id for order_id in order_ids}
+    if len(distinct) != len(order_ids):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Duplicate order IDs"
+        )
+    
+    errors = {order_id: "Invalid order ID" for order_id in order_ids if not ObjectId.is_valid(order_id)}
+    requested = {ObjectId(order_id): order_id for order_id in order_ids if order_id not in errors}
+    changes = [
+        (ObjectId(update.orderId), update.status)
+        for update in bulk_update.updates if update.orderId not in errors
+    ]
+    if changes:
+        failed = await transition_orders(changes, changed_by=current_admin.id)
+        errors.update({requested[order_id]: reason for order_id, reason in failed.items()})
+    
+    results = [
+        {"id": update.orderId, "status": update.status, "updated": False, "error": errors[update.orderId]}
+        if update.orderId in errors else
+        {"id": update.orderId, "status": update.status, "updated": True}
+        for update in bulk_update.updates
+    ]
+    return {
+        "updated": len(results) - len(errors),
+        "failed": len(errors),
+        "results": results
+    }
+
 @router.put("/orders/{order_id}/status")
 async def update_order_status(
     order_id: str,
-    status: str,
+    status_update: Optional[OrderStatusUpdate] = None,
+    status_param: Optional[str] = Query(None, alias="status"),
     current_admin: UserResponse = Depends(get_current_admin_user)
 ):
-    """Update order status (admin only)"""
-    orders = await get_orders_collection()
-    
-    valid_statuses = ["processing", "shipped", "delivered", "cancelled"]
-    if status not in valid_statuses:
+    """Update order status (admin only); the status comes in the body or the query string"""
+    new_status = status_update.status if status_update else status_param
+    if not new_status:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid status. Must be one of: {valid_statuses}"
+            detail="Missing status"
         )
     
     try:
@@ -216,18 +360,14 @@ async def update_order_status(
             detail="Invalid order ID"
         )
     
-    result = await orders.update_one(
-        {"_id": order_obj_id},
-        {"$set": {"status": status, "updatedAt": datetime.now(timezone.utc)}}
-    )
+    order = await transition_order({"_id": order_obj_id}, new_status, changed_by=current_admin.id)
     
-    if result.matched_count == 0:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
-        )
+    order["id"] = str(order["_id"])
+    if order.get("userId"):
+        order["userId"] = str(order["userId"])
+    del order["_id"]
     
-    return {"message": "Order status updated successfully"}
+    return {"message": "Order status updated successfully", "order": order}
 
 @router.delete("/orders/{order_id}")
 async def delete_order(
@@ -245,40 +385,71 @@ async def delete_order(
             detail="Invalid order ID"
         )
     
-    result = await orders.delete_one({"_id": order_obj_id})
+    # The deleted document carries what the counters and rollups need
+    deleted_order = await orders.find_one_and_delete({"_id": order_obj_id})
     
-    if result.deleted_count == 0:
+    if not deleted_order:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Order not found"
         )
     
+    await orders_deleted([deleted_order])
     return {"message": "Order deleted successfully"}
 
 # Dashboard Stats
 @router.get("/stats")
 async def get_dashboard_stats(current_admin: UserResponse = Depends(get_current_admin_user)):
     """Get dashboard statistics (admin only)"""
-    users = await get_users_collection()
-    orders = await get_orders_collection()
-    from database import get_products_collection
-    products = await get_products_collection()
-    
-    # Count documents
-    total_users = await users.count_documents({})
-    total_orders = await orders.count_documents({})
-    total_products = await products.count_documents({})
-    
-    # Calculate total revenue
-    pipeline = [
-        {"$group": {"_id": None, "total_revenue": {"$sum": "$total"}}}
-    ]
-    revenue_result = await orders.aggregate(pipeline).to_list(length=1)
-    total_revenue = revenue_result[0]["total_revenue"] if revenue_result else 0
+    # One small document maintained on the write paths, not a scan per load
+    stats = await get_stats()
     
     return {
-        "totalUsers": total_users,
-        "totalOrders": total_orders,
-        "totalProducts": total_products,
-        "totalRevenue": total_revenue
-    }
\ No newline at end of file
+        "totalUsers": stats.get("users", 0),
+        "totalOrders": stats.get("orders", 0),
+        "totalProducts": stats.get("products", 0),
+        "totalRevenue": round(stats.get("revenue", 0), 2),
+        "ordersByStatus": stats.get("ordersByStatus", {}),
+        "revenueByStatus": {key: round(value, 2) for key, value in stats.get("revenueByStatus", {}).items()},
+        "updatedAt": stats.get("updatedAt")
+    }
+
+@router.get("/analytics/orders")
+async def get_order_analytics(
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    current_admin: UserResponse = Depends(get_current_admin_user)
+):
+    """Order and revenue time series over a date range, from the rollups (admin only)"""
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=30)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must be before end"
+        )
+    if (end - start) / GRANULARITY_STEPS[granularity] > MAX_ANALYTICS_PERIODS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range too long: at most {MAX_ANALYTICS_PERIODS} {granularity} periods"
+        )
+    
+    return await order_series(start, end, granularity)
+
+@router.get("/reports/customers")
+async def get_customer_report(
+    refresh: bool = Query(False),
+    current_admin: UserResponse = Depends(get_current_admin_user)
+):
+    """Retention by first-order month and lifetime value by signup month (admin only)"""
+    return await get_report(refresh=refresh)
+
+@router.get("/cache/stats")
+async def get_cache_stats(current_admin: UserResponse = Depends(get_current_admin_user)):
+    """Get in-process catalog cache counters (admin only)"""
+    return {"caches": cache_stats()}
@@ -6,6 +6,9 @@ from auth import (
     get_current_user, user_to_response, get_user
 )
 from database import get_users_collection
+from cache import user_cache
+from stats import record_stats
+from user_search import search_keys, with_search_keys
 from bson import ObjectId
 from slowapi import Limiter
 from slowapi.util import get_remote_address
@@ -55,8 +58,10 @@ async def register(request: Request, user_data: UserCreate):
     user_dict = user_data.dict()
     user_dict["password"] = hashed_password
     user_dict["avatar"] = "https://images.unsplash.com/photo-1472099645785-5658abf4ff4e?w=100&h=100&fit=crop&crop=face"
+    user_dict["searchKeys"] = search_keys(user_dict)
     
     result = await users.insert_one(user_dict)
+    await record_stats({"users": 1})
     user_dict["_id"] = result.inserted_id
     user_dict["id"] = str(result.inserted_id)
     
@@ -113,8 +118,9 @@ async def update_profile(
     if update_data:
         await users.update_one(
             {"_id": ObjectId(current_user.id)},
-            {"$set": update_data}
+            {"$set": with_search_keys(update_data, current_user.dict())}
         )
+        user_cache.delete(current_user.id)
         
         # Return updated user data (without password)
         updated_user = await users.find_one({"_id": ObjectId(current_user.id)}, {"password": 0})
@@ -1,21 +1,23 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request, Response
+from typing import List, Optional
 from models import Order, OrderCreate, OrderItem, UserResponse
 from auth import get_current_user
-from database import get_orders_collection, get_products_collection
+from database import get_orders_collection, get_orders_archive_collection, get_products_collection
+from projections import (
+    ORDER_FIELDS, ORDER_SUMMARY_PROJECTION, ORDER_SUMMARY_VIEW, ORDER_VIEWS, FieldSelection, select_fields
+)
+from pagination import NEXT_CURSOR_HEADER, apply_cursor, keyset_sort, next_cursor
+from http_cache import PRIVATE_CACHE_CONTROL, conditional, documents_etag
+from inventory import InsufficientStock, decrement_stock, restore_stock, stock_lines
+from order_status import transition_order
+from order_events import orders_created
+from order_numbers import next_order_id
 from bson import ObjectId
 from datetime import datetime, timezone
-import string
-import random
+import asyncio
 
 router = APIRouter()
 
-def generate_order_id():
-    """Generate human readable order ID like CMD001"""
-    prefix = "CMD"
-    suffix = ''.join(random.choices(string.digits, k=3))
-    return f"{prefix}{suffix}"
-
 @router.post("/", response_model=dict)
 async def create_order(
     order_data: OrderCreate,
@@ -25,41 +27,56 @@ async def create_order(
     orders = await get_orders_collection()
     products = await get_products_collection()
     
-    # Validate products and calculate totals
-    total_items = []
-    subtotal = 0.0
+    # Fetch every referenced product in one round trip, then validate in memory
+    invalid_ids = [item.productId for item in order_data.items if not ObjectId.is_valid(item.productId)]
+    if invalid_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid product ID: {', '.join(invalid_ids)}"
+        )
+    
+    product_ids = list({ObjectId(item.productId) for item in order_data.items})
+    found = await products.find(
+        {"_id": {"$in": product_ids}},
+        {"name": 1, "category": 1, "inStock": 1, "variants": {"$slice": 1}}
+    ).to_list(length=None)
+    products_by_id = {str(product["_id"]): product for product in found}
+    tracked = {product_id for product_id, product in products_by_id.items() if product.get("variants")}
     
+    not_found = []
+    out_of_stock = []
     for item in order_data.items:
-        # Get product details from database
-        try:
-            product = await products.find_one({"_id": ObjectId(item.productId)})
-        except:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid product ID: {item.productId}"
-            )
-        
+        product = products_by_id.get(str(ObjectId(item.productId)))
         if not product:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Product not found: {item.productId}"
-            )
-        
-        if not product.get("inStock", True):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Product out of stock: {product['name']}"
-            )
-        
-        # Create order item with validated data
+            if item.productId not in not_found:
+                not_found.append(item.productId)
+        elif not product.get("inStock", True) and product["name"] not in out_of_stock:
+            out_of_stock.append(product["name"])
+    
+    # Report every problem at once so the cart can be fixed in one go
+    if not_found or out_of_stock:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST if out_of_stock else status.HTTP_404_NOT_FOUND,
+            detail={
+                "message": "Some items cannot be ordered",
+                "notFound": not_found,
+                "outOfStock": out_of_stock
+            }
+        )
+    
+    # Create order items with validated data
+    total_items = []
+    subtotal = 0.0
+    for item in order_data.items:
         order_item = OrderItem(
-            productId=item.productId,
+            productId=str(ObjectId(item.productId)),
             name=item.name,
             price=item.price,
             quantity=item.quantity,
             selectedColor=item.selectedColor,
             selectedSize=item.selectedSize,
-            image=item.image
+            image=item.image,
+            category=products_by_id[str(ObjectId(item.productId))].get("category")
         )
         total_items.append(order_item)
         subtotal += item.price * item.quantity
@@ -68,22 +85,46 @@ async def create_order(
     shipping = 0.0 if subtotal >= 50 else 4.99
     total = subtotal + shipping
     
+    # Allocated first: nothing is left to give back if the counter fails
+    order_id = await next_order_id()
+    
+    # Take the stock of every line or of none; concurrent orders for the
+    # last units are arbitrated by the conditional decrements
+    lines = stock_lines(item.dict() for item in total_items)
+    try:
+        await decrement_stock(lines, tracked)
+    except InsufficientStock as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "message": "Insufficient stock for some items",
+                "items": e.items
+            }
+        )
+    
     # Create order
+    now = datetime.now(timezone.utc)
     order_dict = {
         "userId": ObjectId(current_user.id),
-        "orderId": generate_order_id(),
+        "orderId": order_id,
         "items": [item.dict() for item in total_items],
         "status": "processing",
+        "statusHistory": [{"status": "processing", "at": now, "by": current_user.id}],
         "total": total,
         "subtotal": subtotal,
         "shipping": shipping,
         "shippingAddress": order_data.shippingAddress,
         "paymentSessionId": None,
-        "createdAt": datetime.now(timezone.utc),
-        "updatedAt": datetime.now(timezone.utc)
+        "createdAt": now,
+        "updatedAt": now
     }
     
-    result = await orders.insert_one(order_dict)
+    try:
+        result = await orders.insert_one(order_dict)
+    except Exception:
+        await restore_stock(lines, tracked)
+        raise
+    await orders_created([order_dict])
     
     # Return created order
     created_order = await orders.find_one({"_id": result.inserted_id})
@@ -94,27 +135,77 @@ async def create_order(
     return created_order
 
 @router.get("/", response_model=List[dict])
-async def get_user_orders(current_user: UserResponse = Depends(get_current_user)):
-    """Get current user's orders"""
+async def get_user_orders(
+    request: Request,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, max_length=200),
+    fields: Optional[str] = Query(None, max_length=500),
+    view: Optional[str] = Query(None, max_length=20),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Get current user's orders, newest first (summaries unless fields/view say otherwise)"""
     orders = await get_orders_collection()
+    archive = await get_orders_archive_collection()
+    if not fields and view in (None, ORDER_SUMMARY_VIEW):
+        selection = FieldSelection(list(ORDER_SUMMARY_PROJECTION))
+        projection = ORDER_SUMMARY_PROJECTION
+    else:
+        selection = select_fields(fields, view, ORDER_FIELDS, ORDER_VIEWS, internal=("createdAt", "updatedAt"))
+        projection = selection.projection()
+    
+    # Range scan on (userId, createdAt, _id): the cost of a page does not
+    # depend on how many orders the customer has
+    query = apply_cursor({"userId": ObjectId(current_user.id)}, cursor, "createdAt")
+    sort = keyset_sort("createdAt")
+    pipeline = [
+        {"$match": query},
+        {"$sort": dict(sort)},
+        {"$limit": limit}
+    ]
+    if projection:
+        pipeline.append({"$project": projection})
+    
+    # Archived orders share the same index and cursor: read a page from each
+    # collection and keep the newest ``limit`` of both
+    hot, cold = await asyncio.gather(
+        orders.aggregate(pipeline).to_list(length=limit),
+        archive.aggregate(pipeline).to_list(length=limit)
+    )
+    results = sorted(hot + cold, key=lambda order: (order["createdAt"], order["_id"]), reverse=True)[:limit]
     
-    cursor = orders.find({"userId": ObjectId(current_user.id)}).sort("createdAt", -1)
-    results = await cursor.to_list(length=100)
+    token = next_cursor(results, limit, "createdAt")
     
     # Convert ObjectId to string
     for order in results:
         order["id"] = str(order["_id"])
-        order["userId"] = str(order["userId"])
+        if "userId" in order:
+            order["userId"] = str(order["userId"])
         del order["_id"]
     
-    return results
+    etag = documents_etag(results, variant=f"{current_user.id}:{selection.key}:{cursor}")
+    selection.strip(results)
+    not_modified = conditional(
+        request, response, etag, PRIVATE_CACHE_CONTROL, {NEXT_CURSOR_HEADER: token} if token else None
+    )
+    return not_modified or results
+
+@router.get("/count")
+async def count_user_orders(current_user: UserResponse = Depends(get_current_user)):
+    """Number of orders of the current user, archived ones included"""
+    orders = await get_orders_collection()
+    archive = await get_orders_archive_collection()
+    # Counted on the (userId, createdAt, _id) index of each collection
+    query = {"userId": ObjectId(current_user.id)}
+    hot, cold = await asyncio.gather(orders.count_documents(query), archive.count_documents(query))
+    return {"count": hot + cold}
 
 @router.get("/{order_id}", response_model=dict)
 async def get_order(
     order_id: str,
     current_user: UserResponse = Depends(get_current_user)
 ):
-    """Get specific order by ID"""
+    """Get specific order by ID, with its full detail"""
     orders = await get_orders_collection()
     
     try:
@@ -125,10 +216,15 @@ async def get_order(
             detail="Invalid order ID"
         )
     
-    order = await orders.find_one({
+    query = {
         "_id": order_obj_id,
         "userId": ObjectId(current_user.id)
-    })
+    }
+    order = await orders.find_one(query)
+    if not order:
+        # Old finished orders live in the archive
+        archive = await get_orders_archive_collection()
+        order = await archive.find_one(query)
     
     if not order:
         raise HTTPException(
@@ -148,8 +244,6 @@ async def cancel_order(
     current_user: UserResponse = Depends(get_current_user)
 ):
     """Cancel order (if still processing)"""
-    orders = await get_orders_collection()
-    
     try:
         order_obj_id = ObjectId(order_id)
     except:
@@ -158,28 +252,16 @@ async def cancel_order(
             detail="Invalid order ID"
         )
     
-    # Check if order exists and belongs to user
-    order = await orders.find_one({
-        "_id": order_obj_id,
-        "userId": ObjectId(current_user.id)
-    })
-    
-    if not order:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
-        )
-    
-    if order["status"] != "processing":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Order cannot be cancelled"
-        )
-    
-    # Update order status
-    await orders.update_one(
-        {"_id": order_obj_id},
-        {"$set": {"status": "cancelled", "updatedAt": datetime.now(timezone.utc)}}
+    # Ownership, current status and the change itself in one round trip
+    order = await transition_order(
+        {"_id": order_obj_id, "userId": ObjectId(current_user.id)},
+        "cancelled",
+        changed_by=current_user.id,
+        allowed_from=("processing",)
     )
     
-    return {"message": "Order cancelled successfully"}
\ No newline at end of file
+    order["id"] = str(order["_id"])
+    order["userId"] = str(order["userId"])
+    del order["_id"]
+    
+    return {"message": "Order cancelled successfully", "order": order}
@@ -2,13 +2,16 @@ from fastapi import APIRouter, HTTPException, status, Depends, Request
 from typing import List, Dict, Any, Optional
 from models import PaymentTransaction, CheckoutRequest, UserResponse, OrderCreate, OrderItem
 from auth import get_current_user, get_current_user_optional
-from database import get_payment_transactions_collection, get_orders_collection
+from database import get_payment_transactions_collection, get_orders_collection, get_products_collection
+from inventory import InsufficientStock, canonical_product_id, stock_lines
+from order_numbers import next_order_id
+from order_events import orders_created
+from reservations import commit_hold, hold_expiry, hold_stock, attach_session, release_hold, release_session_hold
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
 from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
 from bson import ObjectId
-import uuid
 import stripe
 
 # Load environment variables
@@ -41,7 +44,8 @@ async def create_stripe_checkout_with_bnpl(
     success_url: str,
     cancel_url: str,
     metadata: dict,
-    enable_bnpl: bool = False
+    enable_bnpl: bool = False,
+    expires_at: Optional[int] = None
 ) -> dict:
     """Create Stripe checkout session with optional BNPL support using native Stripe SDK"""
     try:
@@ -76,7 +80,8 @@ async def create_stripe_checkout_with_bnpl(
             success_url=success_url,
             cancel_url=cancel_url,
             metadata=metadata,
-            customer_email=metadata.get("user_email") if metadata.get("user_email") else None
+            customer_email=metadata.get("user_email") if metadata.get("user_email") else None,
+            expires_at=expires_at
         )
         
         return {
@@ -124,7 +129,22 @@ async def create_checkout_session(
         "lastName": checkout_data.shippingAddress.get("lastName", "")
     }
     
+    # Hold the stock while the customer is on the payment page; the hold
+    # expires with the Stripe session
     try:
+        reservation_id = await hold_stock(stock_lines(item.dict() for item in checkout_data.items))
+    except InsufficientStock as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "message": "Insufficient stock for some items",
+                "items": e.items
+            }
+        )
+    
+    try:
+        # Computed last so the session still lives 30+ minutes when Stripe gets it
+        session_expires_at = hold_expiry()
         # Create checkout session with BNPL support using native Stripe SDK
         session_data = await create_stripe_checkout_with_bnpl(
             amount=total,
@@ -132,7 +152,8 @@ async def create_checkout_session(
             success_url=success_url.replace("{CHECKOUT_SESSION_ID}", "{CHECKOUT_SESSION_ID}"),
             cancel_url=cancel_url,
             metadata=metadata,
-            enable_bnpl=enable_bnpl
+            enable_bnpl=enable_bnpl,
+            expires_at=int(session_expires_at.timestamp())
         )
         
         # Save payment transaction to database with full order data
@@ -152,12 +173,14 @@ async def create_checkout_session(
                 "shipping": shipping
             },
             "enableBnpl": enable_bnpl,
+            "reservationId": reservation_id,
             "createdAt": datetime.now(timezone.utc),
             "updatedAt": datetime.now(timezone.utc)
         }
         
         transactions = await get_payment_transactions_collection()
         await transactions.insert_one(transaction_dict)
+        await attach_session(reservation_id, session_data["session_id"], session_expires_at)
         
         return {
             "url": session_data["url"],
@@ -166,6 +189,7 @@ async def create_checkout_session(
         }
         
     except Exception as e:
+        await release_hold(reservation_id)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create checkout session: {str(e)}"
@@ -183,38 +207,56 @@ async def create_order_from_payment(transaction: dict, webhook_response):
         metadata = transaction.get("metadata", {})
         
         # Generate order ID
-        order_id = f"CMD{str(uuid.uuid4())[:8].upper()}"
+        order_id = await next_order_id()
+        
+        # Product categories feed the analytics rollups
+        products = await get_products_collection()
+        product_ids = [ObjectId(item.get("id")) for item in items if ObjectId.is_valid(item.get("id") or "")]
+        categories = {
+            str(product["_id"]): product.get("category")
+            async for product in products.find({"_id": {"$in": product_ids}}, {"category": 1})
+        }
         
         # Convert items to proper format with ObjectId for productId
         order_items = []
         for item in items:
+            product_id = canonical_product_id(item["id"]) if item.get("id") else None
             order_item = {
-                "productId": item.get("id"),
+                "productId": product_id,
                 "name": item.get("name"),
                 "price": item.get("price"),
                 "quantity": item.get("quantity"),
                 "selectedColor": item.get("selectedColor"),
                 "selectedSize": item.get("selectedSize"),
-                "image": item.get("image")
+                "image": item.get("image"),
+                "category": categories.get(product_id)
             }
             order_items.append(order_item)
         
+        # The stock was held at checkout; this makes the sale final
+        stock_committed = await commit_hold(transaction.get("reservationId"), stock_lines(order_items))
+        if not stock_committed:
+            print(f"⚠️ Paid order {order_id} exceeds the remaining stock")
+        
         # Create complete order
         order_dict = {
             "userId": ObjectId(transaction["userId"]) if transaction.get("userId") else None,
             "orderId": order_id,
             "items": order_items,
             "status": "paid",
+            "statusHistory": [{"status": "paid", "at": datetime.now(timezone.utc), "by": "stripe"}],
             "total": transaction["amount"],
             "subtotal": float(order_data.get("subtotal", 0)),
             "shipping": float(order_data.get("shipping", 0)),
             "shippingAddress": shipping_address,
             "paymentSessionId": transaction["sessionId"],
+            "stockCommitted": stock_committed,
             "createdAt": datetime.now(timezone.utc),
             "updatedAt": datetime.now(timezone.utc)
         }
         
         result = await orders.insert_one(order_dict)
+        await orders_created([order_dict])
         print(f"✅ Order created successfully: {order_id} (MongoDB ID: {result.inserted_id})")
         
         return order_id
@@ -249,6 +291,10 @@ async def get_checkout_status(session_id: str, request: Request):
             }
         )
         
+        # Abandoned checkout: no need to wait for the sweeper
+        if checkout_status.status == "expired":
+            await release_session_hold(session_id)
+        
         return {
             "status": checkout_status.status,
             "payment_status": checkout_status.payment_status,
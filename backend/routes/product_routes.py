@@ -1,54 +1,299 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request, Response
 from typing import List, Optional
 from models import Product, ProductCreate, ProductUpdate, UserResponse
 from auth import get_current_admin_user, get_current_user
 from database import get_products_collection
+from pagination import NEXT_CURSOR_HEADER, apply_cursor, keyset_sort, next_cursor
+from cache import product_cache, product_list_cache, category_tag
+from catalog_events import product_written, catalog_reloaded
+from categories import list_categories
+from inventory import variants_in_stock
+from stats import record_stats
+from suggest import suggest_index
+from fuzzy_search import fuzzy_index
+from projections import PRODUCT_FIELDS, PRODUCT_VIEWS, select_fields
+from http_cache import CATALOG_ITEM_CACHE_CONTROL, CATALOG_LIST_CACHE_CONTROL, conditional, documents_etag
+from product_import import default_sku, iter_csv_rows, iter_ndjson_rows, import_products
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime, timezone
 
 router = APIRouter()
 
+PRICE_BANDS = [0, 25, 50, 100, 200, 500]
+
+def _cursor_header(token: Optional[str]) -> dict:
+    return {NEXT_CURSOR_HEADER: token} if token else {}
+
+def _split_list(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+class ProductFilters:
+    """Catalog filters shared by the product listing and faceted search"""
+
+    def __init__(
+        self,
+        category: Optional[str] = Query(None, max_length=100),
+        search: Optional[str] = Query(None, max_length=200),
+        search_mode: str = Query("text", pattern="^(text|regex|fuzzy)$"),
+        colors: Optional[str] = Query(None, max_length=500),
+        sizes: Optional[str] = Query(None, max_length=500),
+        min_price: Optional[float] = Query(None, ge=0),
+        max_price: Optional[float] = Query(None, ge=0),
+        in_stock: Optional[bool] = Query(None)
+    ):
+        self.category = None
+        if category and category != "tous":
+            # Sanitize category - only allow alphanumeric and hyphens
+            self.category = ''.join(c for c in category if c.isalnum() or c in ['-', '_']) or None
+        self.search = search or None
+        self.search_mode = search_mode
+        self.colors = sorted(set(_split_list(colors)))
+        self.sizes = sorted(set(_split_list(sizes)))
+        self.min_price = min_price
+        self.max_price = max_price
+        self.in_stock = in_stock
+        self._fuzzy_ids = None
+
+    @property
+    def relevance_sorted(self) -> bool:
+        return bool(self.search) and self.search_mode in ("text", "fuzzy")
+
+    def fuzzy_ids(self) -> List[ObjectId]:
+        """Ids of the trigram index matches, best first"""
+        if self._fuzzy_ids is None:
+            self._fuzzy_ids = [
+                ObjectId(product_id) for product_id, _ in fuzzy_index.search(self.search)
+                if ObjectId.is_valid(product_id)
+            ]
+        return self._fuzzy_ids
+
+    def relevance_stage(self) -> dict:
+        """Aggregation stage adding a ``score`` field (higher is better)"""
+        if self.search_mode == "fuzzy":
+            return {"$addFields": {"score": {"$subtract": [0, {"$indexOfArray": [self.fuzzy_ids(), "$_id"]}]}}}
+        return {"$addFields": {"score": {"$meta": "textScore"}}}
+
+    def cache_key(self) -> tuple:
+        """Normalized identity of the filters, so equivalent requests share cache entries"""
+        normalized_search = None
+        if self.search:
+            normalized_search = " ".join(self.search.lower().split()) if self.search_mode != "regex" else self.search.lower()
+        return (
+            self.category,
+            normalized_search,
+            self.search_mode if normalized_search else None,
+            tuple(self.colors),
+            tuple(self.sizes),
+            self.min_price,
+            self.max_price,
+            self.in_stock
+        )
+
+    def query(self) -> dict:
+        """MongoDB filter for the selected products"""
+        query = {}
+        if self.category:
+            query["category"] = self.category
+        
+        # "text" uses the weighted French text index sorted by relevance,
+        # "fuzzy" the in-memory trigram index (typos, missing accents),
+        # "regex" keeps the legacy (unindexed) substring match
+        if self.search and self.search_mode == "fuzzy":
+            query["_id"] = {"$in": self.fuzzy_ids()}
+        elif self.search and self.search_mode == "text":
+            # Other filters stay in the same query so they are applied while
+            # walking the text index matches instead of after the page is fetched
+            query["$text"] = {"$search": self.search}
+        elif self.search:
+            # Sanitize search - escape special regex characters
+            import re
+            sanitized_search = re.escape(self.search)
+            query["$or"] = [
+                {"name": {"$regex": sanitized_search, "$options": "i"}},
+                {"description": {"$regex": sanitized_search, "$options": "i"}}
+            ]
+        
+        if self.colors:
+            query["colors"] = {"$in": self.colors}
+        if self.sizes:
+            query["sizes"] = {"$in": self.sizes}
+        if self.min_price is not None or self.max_price is not None:
+            query["price"] = {}
+            if self.min_price is not None:
+                query["price"]["$gte"] = self.min_price
+            if self.max_price is not None:
+                query["price"]["$lte"] = self.max_price
+        if self.in_stock is not None:
+            query["inStock"] = self.in_stock
+        return query
+
 @router.get("/", response_model=List[dict])
 async def get_products(
-    category: Optional[str] = Query(None, max_length=100),
-    search: Optional[str] = Query(None, max_length=200),
+    request: Request,
+    response: Response,
+    filters: ProductFilters = Depends(),
     skip: int = Query(0, ge=0),
-    limit: int = Query(100, le=100)
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, max_length=200),
+    fields: Optional[str] = Query(None, max_length=500),
+    view: Optional[str] = Query(None, max_length=20)
 ):
     """Get all products with optional filtering"""
+    # Sparse fieldset; sort key and version are fetched for the cursor and ETag
+    selection = select_fields(fields, view, PRODUCT_FIELDS, PRODUCT_VIEWS, internal=("createdAt", "updatedAt"))
+    
+    if filters.relevance_sorted and cursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor pagination is not available for relevance-sorted search"
+        )
+    
+    # Serve repeated listings from the in-process cache
+    cache_key = (
+        filters.cache_key(),
+        None if cursor else skip,
+        limit,
+        cursor,
+        selection.key
+    )
+    cached = product_list_cache.get(cache_key)
+    if cached is not None:
+        results, token, etag = cached
+        not_modified = conditional(request, response, etag, CATALOG_LIST_CACHE_CONTROL, _cursor_header(token))
+        return not_modified or results
+    
     products = await get_products_collection()
+    query = filters.query()
     
-    # Build query with sanitized inputs
-    query = {}
-    if category and category != "tous":
-        # Sanitize category - only allow alphanumeric and hyphens
-        sanitized_category = ''.join(c for c in category if c.isalnum() or c in ['-', '_'])
-        if sanitized_category:
-            query["category"] = sanitized_category
-    
-    if search:
-        # Sanitize search - escape special regex characters
-        import re
-        sanitized_search = re.escape(search)
-        query["$or"] = [
-            {"name": {"$regex": sanitized_search, "$options": "i"}},
-            {"description": {"$regex": sanitized_search, "$options": "i"}}
+    # Execute query - relevance order for text/fuzzy search, otherwise newest
+    # first, paged by cursor when given, else by skip
+    projection = selection.projection()
+    if filters.relevance_sorted:
+        pipeline = [
+            {"$match": query},
+            filters.relevance_stage(),
+            {"$sort": {"score": -1, "_id": -1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": projection} if projection else {"$unset": "score"}
         ]
+        results = await products.aggregate(pipeline).to_list(length=limit)
+    else:
+        if cursor:
+            db_cursor = products.find(apply_cursor(query, cursor, "createdAt"), projection).sort(keyset_sort("createdAt"))
+        else:
+            db_cursor = products.find(query, projection).sort(keyset_sort("createdAt")).skip(skip)
+        results = await db_cursor.limit(limit).to_list(length=limit)
     
-    # Execute query
-    cursor = products.find(query).skip(skip).limit(limit)
-    results = await cursor.to_list(length=limit)
+    token = None if filters.relevance_sorted else next_cursor(results, limit, "createdAt")
     
     # Convert ObjectId to string
     for product in results:
         product["id"] = str(product["_id"])
         del product["_id"]
     
-    return results
+    etag = documents_etag(results, variant=repr(cache_key))
+    selection.strip(results)
+    product_list_cache.set(cache_key, (results, token, etag), tags=[category_tag(filters.category)])
+    not_modified = conditional(request, response, etag, CATALOG_LIST_CACHE_CONTROL, _cursor_header(token))
+    return not_modified or results
+
+@router.get("/facets", response_model=dict)
+async def get_product_facets(
+    filters: ProductFilters = Depends(),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(24, ge=1, le=100),
+    fields: Optional[str] = Query(None, max_length=500),
+    view: Optional[str] = Query(None, max_length=20)
+):
+    """Get a page of products plus category/color/size/price/stock counts in one query"""
+    selection = select_fields(fields, view, PRODUCT_FIELDS, PRODUCT_VIEWS)
+    cache_key = ("facets", filters.cache_key(), skip, limit, selection.key)
+    cached = product_list_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    products = await get_products_collection()
+    
+    if filters.relevance_sorted:
+        page_stages = [{"$sort": {"score": -1, "_id": -1}}]
+    else:
+        page_stages = [{"$sort": {"createdAt": -1, "_id": -1}}]
+    page_stages += [{"$skip": skip}, {"$limit": limit}]
+    projection = selection.projection()
+    if projection:
+        page_stages.append({"$project": projection})
+    elif filters.relevance_sorted:
+        page_stages.append({"$project": {"score": 0}})
+    
+    # Facet counts reflect every active filter
+    pipeline = [{"$match": filters.query()}]
+    if filters.relevance_sorted:
+        pipeline.append(filters.relevance_stage())
+    pipeline.append({"$facet": {
+        "items": page_stages,
+        "total": [{"$count": "count"}],
+        "categories": [{"$sortByCount": "$category"}],
+        "colors": [{"$unwind": "$colors"}, {"$sortByCount": "$colors"}],
+        "sizes": [{"$unwind": "$sizes"}, {"$sortByCount": "$sizes"}],
+        "priceBands": [{"$bucket": {
+            "groupBy": "$price",
+            "boundaries": PRICE_BANDS,
+            "default": "other",
+            "output": {"count": {"$sum": 1}}
+        }}],
+        "inStock": [{"$group": {"_id": "$inStock", "count": {"$sum": 1}}}]
+    }})
+    
+    facets = (await products.aggregate(pipeline).to_list(length=1))[0]
+    
+    # Convert ObjectId to string
+    for product in facets["items"]:
+        product["id"] = str(product["_id"])
+        del product["_id"]
+    
+    price_bands = []
+    for band in facets["priceBands"]:
+        if band["_id"] == "other":
+            price_bands.append({"min": PRICE_BANDS[-1], "max": None, "count": band["count"]})
+        else:
+            upper = PRICE_BANDS[PRICE_BANDS.index(band["_id"]) + 1]
+            price_bands.append({"min": band["_id"], "max": upper, "count": band["count"]})
+    
+    result = {
+        "items": facets["items"],
+        "total": facets["total"][0]["count"] if facets["total"] else 0,
+        "facets": {
+            "categories": [{"value": f["_id"], "count": f["count"]} for f in facets["categories"]],
+            "colors": [{"value": f["_id"], "count": f["count"]} for f in facets["colors"]],
+            "sizes": [{"value": f["_id"], "count": f["count"]} for f in facets["sizes"]],
+            "priceBands": price_bands,
+            "inStock": {
+                "true": sum(f["count"] for f in facets["inStock"] if f["_id"] is not False),
+                "false": sum(f["count"] for f in facets["inStock"] if f["_id"] is False)
+            }
+        }
+    }
+    product_list_cache.set(cache_key, result, tags=[category_tag(filters.category)])
+    return result
+
+@router.get("/suggest", response_model=List[dict])
+async def suggest_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(8, ge=1, le=20)
+):
+    """Search-as-you-type suggestions from the in-memory prefix index"""
+    return suggest_index.suggest(q, limit)
 
 @router.get("/{product_id}", response_model=dict)
-async def get_product(product_id: str):
+async def get_product(product_id: str, request: Request, response: Response):
     """Get single product by ID"""
+    cached = product_cache.get(product_id)
+    if cached is not None:
+        not_modified = conditional(request, response, documents_etag([cached]), CATALOG_ITEM_CACHE_CONTROL)
+        return not_modified or cached
+    
     products = await get_products_collection()
     
     try:
@@ -67,7 +312,9 @@ async def get_product(product_id: str):
     
     product["id"] = str(product["_id"])
     del product["_id"]
-    return product
+    product_cache.set(product_id, product)
+    not_modified = conditional(request, response, documents_etag([product]), CATALOG_ITEM_CACHE_CONTROL)
+    return not_modified or product
 
 @router.post("/", response_model=dict)
 async def create_product(
@@ -78,18 +325,60 @@ async def create_product(
     products = await get_products_collection()
     
     product_dict = product.dict()
+    sku_given = bool(product_dict.get("sku"))
+    if not sku_given:
+        # The key bulk imports match on, so a feed re-importing it updates it
+        product_dict["sku"] = default_sku(product.name)
+    if product_dict.get("variants"):
+        product_dict["inStock"] = variants_in_stock(product_dict["variants"])
+    else:
+        product_dict.pop("variants", None)
     product_dict["createdAt"] = datetime.now(timezone.utc)
     product_dict["updatedAt"] = datetime.now(timezone.utc)
     
-    result = await products.insert_one(product_dict)
+    try:
+        result = await products.insert_one(product_dict)
+    except DuplicateKeyError:
+        if sku_given:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="SKU already in use"
+            )
+        # Another product has the same name; insert_one already set the _id
+        product_dict["sku"] = f"{product_dict['sku']}-{product_dict['_id']}"
+        result = await products.insert_one(product_dict)
     
     # Return created product
     created_product = await products.find_one({"_id": result.inserted_id})
     created_product["id"] = str(created_product["_id"])
     del created_product["_id"]
     
+    await product_written(created_product["id"], None, created_product)
     return created_product
 
+@router.post("/import")
+async def bulk_import_products(
+    request: Request,
+    file_format: Optional[str] = Query(None, alias="format", pattern="^(ndjson|csv)$"),
+    current_admin: UserResponse = Depends(get_current_admin_user)
+):
+    """Bulk import products from a streamed NDJSON or CSV upload (admin only)"""
+    if file_format is None:
+        content_type = request.headers.get("content-type", "")
+        file_format = "csv" if "csv" in content_type else "ndjson"
+    
+    # Rows are validated and upserted on SKU (slug of the name when absent)
+    # batch by batch as the upload streams in
+    products = await get_products_collection()
+    parse_rows = iter_csv_rows if file_format == "csv" else iter_ndjson_rows
+    report = await import_products(products, parse_rows(request.stream()))
+    await record_stats({"products": report["inserted"]})
+    
+    # An import can touch any product of any category
+    await catalog_reloaded()
+    
+    return report
+
 @router.put("/{product_id}", response_model=dict)
 async def update_product(
     product_id: str,
@@ -120,19 +409,29 @@ async def update_product(
     for field, value in product_update.dict(exclude_unset=True).items():
         if value is not None:
             update_data[field] = value
+    # Setting variants replaces the stock counters; the flag follows them
+    if update_data.get("variants"):
+        update_data["inStock"] = variants_in_stock(update_data["variants"])
     
     if update_data:
         update_data["updatedAt"] = datetime.now(timezone.utc)
-        await products.update_one(
-            {"_id": product_obj_id},
-            {"$set": update_data}
-        )
+        try:
+            await products.update_one(
+                {"_id": product_obj_id},
+                {"$set": update_data}
+            )
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="SKU already in use"
+            )
     
     # Return updated product
     updated_product = await products.find_one({"_id": product_obj_id})
     updated_product["id"] = str(updated_product["_id"])
     del updated_product["_id"]
     
+    await product_written(updated_product["id"], existing_product, updated_product)
     return updated_product
 
 @router.delete("/{product_id}")
@@ -151,22 +450,20 @@ async def delete_product(
             detail="Invalid product ID"
         )
     
-    result = await products.delete_one({"_id": product_obj_id})
+    # find_one_and_delete hands back the category, needed to invalidate the
+    # matching cached list pages and update the category registry
+    deleted_product = await products.find_one_and_delete({"_id": product_obj_id})
     
-    if result.deleted_count == 0:
+    if not deleted_product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product not found"
         )
     
+    await product_written(product_id, deleted_product, None)
     return {"message": "Product deleted successfully"}
 
 @router.get("/categories/list")
 async def get_categories():
-    """Get list of product categories"""
-    return [
-        {"id": "tous", "name": "Tous les produits", "slug": "tous"},
-        {"id": "sacs-a-main", "name": "Sacs à Main", "slug": "sacs-a-main"},
-        {"id": "chaussures-femmes", "name": "Chaussures Femmes", "slug": "chaussures-femmes"},
-        {"id": "chaussures-enfants", "name": "Chaussures Enfants", "slug": "chaussures-enfants"}
-    ]
\ No newline at end of file
+    """Get list of product categories with product counts and price range"""
+    return await list_categories()
@@ -4,7 +4,18 @@ from starlette.middleware.cors import CORSMiddleware
 from pathlib import Path
 import os
 import logging
-from database import connect_to_mongo, close_mongo_connection
+from database import connect_to_mongo, close_mongo_connection, create_indexes
+from cache_bus import start_cache_bus, stop_cache_bus
+from categories import ensure_categories
+from catalog_events import load_search_indexes
+from reservations import start_reservation_sweeper, stop_reservation_sweeper
+from order_archive import ensure_order_archive, start_order_archiver, stop_order_archiver
+from stats import start_stats_reconciler, stop_stats_reconciler
+from rollups import ensure_rollups
+from user_search import ensure_user_search_keys
+from product_import import ensure_product_skus
+from reports import start_report_refresher, stop_report_refresher
+from idempotency import IdempotencyMiddleware, REPLAYED_HEADER
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -54,12 +65,20 @@ app.include_router(api_router)
 allowed_origins = os.environ.get("ALLOWED_ORIGINS", "http://localhost:3000").split(",")
 allowed_origins = [origin.strip() for origin in allowed_origins]  # Clean whitespace
 
+# Retried order/checkout creations replay the first response (added before
+# CORS so replayed responses still get the CORS headers)
+app.add_middleware(
+    IdempotencyMiddleware,
+    paths=["/api/orders/", "/api/payments/checkout/session"]
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=allowed_origins,
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", REPLAYED_HEADER],
 )
 
 # Configure logging
@@ -77,10 +96,27 @@ async def startup_db_client():
     validate_secret_key()
     
     await connect_to_mongo()
+    await create_indexes()
+    await ensure_categories()
+    await ensure_order_archive()
+    await ensure_rollups()
+    await ensure_user_search_keys()
+    await ensure_product_skus()
+    await load_search_indexes()
+    start_cache_bus()
+    start_reservation_sweeper()
+    start_order_archiver()
+    start_stats_reconciler()
+    start_report_refresher()
     logger.info("TKB'Shop API started successfully")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     """Close database connection on shutdown"""
+    await stop_cache_bus()
+    await stop_reservation_sweeper()
+    await stop_order_archiver()
+    await stop_stats_reconciler()
+    await stop_report_refresher()
     await close_mongo_connection()
     logger.info("TKB'Shop API shutdown complete")
@@ -0,0 +1,133 @@
+"""In-memory prefix index for search-as-you-type product suggestions"""
+import heapq
+from bisect import bisect_left, insort
+from operator import itemgetter
+from typing import Iterable, List
+from categories import category_name
+from text_utils import normalize
+
+# Sorts after every character, so (prefix + KEY_END,) bounds the prefix range
+KEY_END = "\U0010ffff"
+# Prefixes matching more keys than this keep their best TOP_K products, kept
+# up to date on write, instead of ranking the range on every keystroke
+WIDE_RANGE = 1000
+TOP_K = 20
+# Prefixes this short are nearly always wide: their lists are built with the index
+TOP_PREFIX_LENGTH = 2
+
+class SuggestIndex:
+    """Sorted array of accent-folded keys searched with bisect.
+
+    Every product is reachable from its full name, from each word of its name
+    onwards ("argent" finds "Chaîne Argent Élégante") and from its category.
+    Keys carry the product's rank, so a prefix range is ranked by plain tuple
+    comparison; wide prefixes read their precomputed top list instead.
+    """
+
+    def __init__(self):
+        self._keys: List[tuple] = []
+        self._top: dict = {}
+        self._products: dict = {}
+
+    def __len__(self):
+        return len(self._products)
+
+    @staticmethod
+    def _keys_for(product: dict) -> set:
+        words = normalize(product.get("name") or "").split()
+        keys = {" ".join(words[i:]) for i in range(len(words))}
+        if product.get("category"):
+            keys.add(normalize(category_name(product["category"])))
+        keys.discard("")
+        return keys
+
+    @staticmethod
+    def _prefixes(entry: dict, max_length: int = None) -> set:
+        return {key[:length] for key in entry["keys"] for length in range(1, len(key[:max_length]) + 1)}
+
+    def _entry(self, product: dict) -> dict:
+        entry = {
+            "id": str(product.get("id") or product["_id"]),
+            "name": product.get("name"),
+            "category": product.get("category"),
+            "image": product.get("image"),
+            "price": product.get("price"),
+            "rating": product.get("rating") or 0,
+            "reviews": product.get("reviews") or 0,
+            "keys": self._keys_for(product)
+        }
+        # Best rated first, then most reviewed, then by name
+        entry["rank"] = (-entry["rating"], -entry["reviews"], entry["name"] or "", entry["id"])
+        return entry
+
+    def upsert(self, product: dict):
+        """Add or refresh one product (document with ``_id`` or ``id``)"""
+        entry = self._entry(product)
+        self.remove(entry["id"])
+        self._products[entry["id"]] = entry
+        for key in entry["keys"]:
+            insort(self._keys, (key, entry["rank"]))
+        for prefix in self._prefixes(entry):
+            top = self._top.get(prefix)
+            if top is not None and (len(top) < TOP_K or entry["rank"] < top[-1]):
+                insort(top, entry["rank"])
+                del top[TOP_K:]
+
+    def remove(self, product_id: str):
+        entry = self._products.pop(product_id, None)
+        if not entry:
+            return
+        for key in entry["keys"]:
+            position = bisect_left(self._keys, (key, entry["rank"]))
+            if position < len(self._keys) and self._keys[position] == (key, entry["rank"]):
+                del self._keys[position]
+        for prefix in self._prefixes(entry):
+            top = self._top.get(prefix)
+            if top is not None and entry["rank"] in top:
+                # Refilled from the key range on the next lookup
+                del self._top[prefix]
+
+    def rebuild(self, products: Iterable[dict]):
+        self._keys = []
+        self._products = {}
+        for product in products:
+            entry = self._entry(product)
+            self._products[entry["id"]] = entry
+            self._keys.extend((key, entry["rank"]) for key in entry["keys"])
+        self._keys.sort()
+        self._top = {}
+        for entry in sorted(self._products.values(), key=itemgetter("rank")):
+            for prefix in self._prefixes(entry, TOP_PREFIX_LENGTH):
+                top = self._top.setdefault(prefix, [])
+                if len(top) < TOP_K:
+                    top.append(entry["rank"])
+
+    def replace(self, other: "SuggestIndex"):
+        """Take over the contents of an index built elsewhere (e.g. in a thread)"""
+        self._keys, self._top, self._products = other._keys, other._top, other._products
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[dict]:
+        """Best rated products having a key starting with ``prefix``"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        top = self._top.get(prefix)
+        if top is not None and limit <= TOP_K:
+            ranked = top[:limit]
+        else:
+            start = bisect_left(self._keys, (prefix,))
+            end = bisect_left(self._keys, (prefix + KEY_END,), start)
+            # A product has one key per word, several of which may share the prefix
+            matches = {rank for _, rank in self._keys[start:end]}
+            if end - start > WIDE_RANGE and limit <= TOP_K:
+                self._top[prefix] = heapq.nsmallest(TOP_K, matches)
+                ranked = self._top[prefix][:limit]
+            else:
+                ranked = heapq.nsmallest(limit, matches)
+        return [
+            {field: self._products[rank[-1]][field] for field in ("id", "name", "category", "image", "price", "rating")}
+            for rank in ranked
+        ]
+
+suggest_index = SuggestIndex()
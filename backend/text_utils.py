@@ -0,0 +1,19 @@
+"""Text normalization helpers shared by search, slugs and lookups"""
+import re
+import unicodedata
+
+# Letters that do not decompose into base letter + combining accent
+_LIGATURES = str.maketrans({"œ": "oe", "Œ": "OE", "æ": "ae", "Æ": "AE", "ß": "ss"})
+
+def fold_accents(text: str) -> str:
+    """Strip accents: "Élégante Chaîne" -> "Elegante Chaine" """
+    decomposed = unicodedata.normalize("NFKD", text.translate(_LIGATURES))
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+def normalize(text: str) -> str:
+    """Accent-folded, lower-cased text with collapsed whitespace"""
+    return " ".join(fold_accents(text).lower().split())
+
+def slugify(text: str) -> str:
+    """URL/identifier-safe slug: "Sac à Main Cuir" -> "sac-a-main-cuir" """
+    return re.sub(r"[^a-z0-9]+", "-", normalize(text)).strip("-")
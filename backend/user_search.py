@@ -0,0 +1,59 @@
+"""Indexed prefix search over customer names and emails
+
+Every user document carries ``searchKeys``: accent-folded, lower-cased
+first name, last name, full name (both orders) and email. Admin lookups
+are anchored, case-sensitive prefix regexes on that multikey index, which
+MongoDB answers with an index range scan instead of a collection scan.
+"""
+import re
+from typing import List
+from pymongo import UpdateOne
+from database import get_database
+from text_utils import normalize
+
+SEARCH_FIELDS = ("firstName", "lastName", "email")
+BACKFILL_BATCH_SIZE = 1000
+
+def search_keys(user: dict) -> List[str]:
+    first = normalize(user.get("firstName") or "")
+    last = normalize(user.get("lastName") or "")
+    email = normalize(user.get("email") or "")
+    keys = {first, last, email, f"{first} {last}".strip(), f"{last} {first}".strip()}
+    # Compound names: "marie claire" is also found from "claire"
+    keys.update(first.split())
+    keys.update(last.split())
+    keys.discard("")
+    return sorted(keys)
+
+def with_search_keys(update: dict, current: dict) -> dict:
+    """Add the recomputed keys to a ``$set`` touching any searched field"""
+    if any(field in update for field in SEARCH_FIELDS):
+        return {**update, "searchKeys": search_keys({**current, **update})}
+    return update
+
+def search_query(search: str) -> dict:
+    """Anchored prefix match on the normalized search text"""
+    prefix = normalize(search)
+    if not prefix:
+        return {}
+    return {"searchKeys": {"$regex": f"^{re.escape(prefix)}"}}
+
+async def ensure_user_search_keys():
+    """Backfill ``searchKeys`` on users written before they existed"""
+    try:
+        database = await get_database()
+        cursor = database.users.find(
+            {"searchKeys": {"$exists": False}},
+            {field: 1 for field in SEARCH_FIELDS},
+            batch_size=BACKFILL_BATCH_SIZE
+        )
+        operations = []
+        async for user in cursor:
+            operations.append(UpdateOne({"_id": user["_id"]}, {"$set": {"searchKeys": search_keys(user)}}))
+            if len(operations) == BACKFILL_BATCH_SIZE:
+                await database.users.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            await database.users.bulk_write(operations, ordered=False)
+    except Exception as e:
+        print(f"Error backfilling user search keys: {e}")
@@ -136,17 +136,32 @@ export const AuthProvider = ({ children }) => {
     }
   };
 
-  const getUserOrders = async (userId) => {
+  // One page of orders; pass the returned nextCursor to get the following one
+  const getUserOrders = async (userId, cursor = null) => {
     try {
       // Import ordersAPI
       const { ordersAPI } = await import('../services/api');
       
       // Fetch real orders from backend
-      const response = await ordersAPI.getAll();
-      return response.data;
+      const response = await ordersAPI.getAll(cursor ? { cursor } : {});
+      return {
+        orders: response.data,
+        nextCursor: response.headers['x-next-cursor'] || null
+      };
     } catch (error) {
       console.error('Error fetching user orders:', error);
-      return [];
+      return { orders: [], nextCursor: null };
+    }
+  };
+
+  const getUserOrderCount = async () => {
+    try {
+      const { ordersAPI } = await import('../services/api');
+      const response = await ordersAPI.count();
+      return response.data.count;
+    } catch (error) {
+      console.error('Error counting user orders:', error);
+      return null;
     }
   };
 
@@ -170,6 +185,7 @@ export const AuthProvider = ({ children }) => {
       logout,
       updateProfile,
       getUserOrders,
+      getUserOrderCount,
       getAllOrders,
       getAllUsers
     }}>
@@ -5,10 +5,13 @@ import { useAuth } from '../context/AuthContext';
 import { useToast } from '../components/Toast';
 
 const ProfilePage = () => {
-  const { user, updateProfile, getUserOrders, logout } = useAuth();
+  const { user, updateProfile, getUserOrders, getUserOrderCount, logout } = useAuth();
   const { addToast } = useToast();
   const [isEditing, setIsEditing] = useState(false);
   const [orders, setOrders] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [orderCount, setOrderCount] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [formData, setFormData] = useState({
     firstName: user?.firstName || '',
     lastName: user?.lastName || '',
@@ -17,16 +20,27 @@ const ProfilePage = () => {
     address: user?.address || ''
   });
 
-  // Load user orders
+  // Load the first page of orders and the total count
   useEffect(() => {
     const loadOrders = async () => {
       if (user?.id) {
-        const userOrders = await getUserOrders(user.id);
-        setOrders(Array.isArray(userOrders) ? userOrders : []);
+        const [page, count] = await Promise.all([getUserOrders(user.id), getUserOrderCount()]);
+        setOrders(Array.isArray(page.orders) ? page.orders : []);
+        setNextCursor(page.nextCursor);
+        setOrderCount(count);
       }
     };
     loadOrders();
-  }, [user?.id, getUserOrders]);
+  }, [user?.id, getUserOrders, getUserOrderCount]);
+
+  const loadMoreOrders = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    const page = await getUserOrders(user.id, nextCursor);
+    setOrders(prev => [...prev, ...(Array.isArray(page.orders) ? page.orders : [])]);
+    setNextCursor(page.nextCursor);
+    setLoadingMore(false);
+  };
 
   const handleChange = (e) => {
     setFormData({
@@ -130,7 +144,7 @@ const ProfilePage = () => {
 
               <div className="space-y-4">
                 <div className="text-center">
-                  <div className="text-2xl font-bold text-pink-600">{orders.length}</div>
+                  <div className="text-2xl font-bold text-pink-600">{orderCount ?? orders.length}</div>
                   <div className="text-sm text-gray-600">Commandes</div>
                 </div>
               </div>
@@ -295,22 +309,31 @@ const ProfilePage = () => {
                         </div>
                       </div>
                       
-                      <div className="space-y-2">
-                        {order.items && order.items.length > 0 ? (
-                          order.items.map((item, index) => (
-                            <div key={index} className="flex justify-between text-sm">
-                              <span className="text-gray-600">
-                                {item.name} x{item.quantity}
-                              </span>
-                              <span className="text-gray-900">{item.price.toFixed(2)}€</span>
-                            </div>
-                          ))
-                        ) : (
-                          <p className="text-sm text-gray-500 italic">Détails des articles non disponibles</p>
+                      <div className="flex items-center space-x-3">
+                        {order.firstImage && (
+                          <img
+                            src={order.firstImage}
+                            alt=""
+                            className="h-12 w-12 rounded-md object-cover"
+                          />
                         )}
+                        <p className="text-sm text-gray-600">
+                          {order.itemCount || 0} article{order.itemCount > 1 ? 's' : ''}
+                        </p>
                       </div>
                     </div>
                   ))}
+                  {nextCursor && (
+                    <div className="text-center pt-2">
+                      <button
+                        onClick={loadMoreOrders}
+                        disabled={loadingMore}
+                        className="px-6 py-2 text-pink-600 border border-pink-200 rounded-lg hover:bg-pink-50 transition-colors duration-200 disabled:opacity-50"
+                      >
+                        {loadingMore ? 'Chargement...' : 'Voir plus de commandes'}
+                      </button>
+                    </div>
+                  )}
                 </div>
               )}
             </div>
@@ -54,7 +54,8 @@ export const productsAPI = {
 // Orders API
 export const ordersAPI = {
   create: (orderData) => api.post('/orders/', orderData),
-  getAll: () => api.get('/orders/'),
+  getAll: (params = {}) => api.get('/orders/', { params }),
+  count: () => api.get('/orders/count'),
   getById: (id) => api.get(`/orders/${id}`),
   cancel: (id) => api.put(`/orders/${id}/cancel`),
 };
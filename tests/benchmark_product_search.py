@@ -0,0 +1,106 @@
+"""Benchmark of catalog search: ``search_mode=regex`` against ``search_mode=text``
+
+    MONGO_URL=mongodb://localhost:27017 python tests/benchmark_product_search.py [products]   (default 100,000)
+
+Seeds a throwaway database with copies of the seed catalog, creates the API
+indexes and times the query ``GET /api/products?search=...`` runs in each
+mode (first page of 20, no response cache). The database is dropped afterwards.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+import motor.motor_asyncio  # noqa: E402
+from add_bijoux_products import bijoux_products  # noqa: E402
+from database import create_indexes, db  # noqa: E402
+from init_data import mock_products  # noqa: E402
+from routes.product_routes import ProductFilters  # noqa: E402
+
+SEARCHES = ["sac", "noir", "collier perles", "escarpins classiques", "pochette soirée"]
+REPEATS = 20
+PAGE_SIZE = 20
+INSERT_BATCH_SIZE = 5000
+
+def synthetic_products(count: int) -> list:
+    """Seed products renamed by edition, one minute apart"""
+    seed = list({product["name"]: product for product in mock_products + bijoux_products}.values())
+    editions = ["Luxe", "Edition", "Collection", "Classique", "Mode"]
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        {**seed[number % len(seed)],
+         "name": f"{seed[number % len(seed)]['name']} {editions[number % 5]} {number % 997}",
+         "createdAt": start + timedelta(minutes=number)}
+        for number in range(count)
+    ]
+
+def filters(search: str, search_mode: str) -> ProductFilters:
+    return ProductFilters(
+        category=None, search=search, search_mode=search_mode, colors=None, sizes=None,
+        min_price=None, max_price=None, in_stock=None
+    )
+
+async def first_page(products, search: str, search_mode: str) -> list:
+    """The database work of the product listing route for one search"""
+    selected = filters(search, search_mode)
+    query = selected.query()
+    if selected.relevance_sorted:
+        pipeline = [
+            {"$match": query},
+            selected.relevance_stage(),
+            {"$sort": {"score": -1, "_id": -1}},
+            {"$limit": PAGE_SIZE},
+            {"$unset": "score"}
+        ]
+        return await products.aggregate(pipeline).to_list(length=PAGE_SIZE)
+    cursor = products.find(query).sort([("createdAt", -1), ("_id", -1)]).limit(PAGE_SIZE)
+    return await cursor.to_list(length=PAGE_SIZE)
+
+async def run(product_count: int):
+    mongo_url = os.environ.get("MONGO_URL")
+    if not mongo_url:
+        sys.exit("MONGO_URL is not set")
+    client = motor.motor_asyncio.AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=2000)
+    try:
+        await client.admin.command("ping")
+    except Exception as e:
+        client.close()
+        sys.exit(f"MongoDB unreachable: {e}")
+
+    name = f"benchmark_search_{uuid.uuid4().hex[:12]}"
+    db.client, db.database = client, client[name]
+    try:
+        products = synthetic_products(product_count)
+        started = time.perf_counter()
+        for offset in range(0, len(products), INSERT_BATCH_SIZE):
+            await db.database.products.insert_many(products[offset:offset + INSERT_BATCH_SIZE])
+        await create_indexes()
+        print(f"products:    {product_count:,} seeded and indexed in {time.perf_counter() - started:.1f} s")
+
+        for search_mode in ("regex", "text"):
+            times = []
+            for _ in range(REPEATS):
+                for search in SEARCHES:
+                    started = time.perf_counter()
+                    await first_page(db.database.products, search, search_mode)
+                    times.append(time.perf_counter() - started)
+            print(
+                f"{search_mode + ':':<12} median {statistics.median(times) * 1000:.1f} ms, "
+                f"p95 {statistics.quantiles(times, n=20)[-1] * 1000:.1f} ms, "
+                f"max {max(times) * 1000:.1f} ms"
+            )
+    finally:
+        await client.drop_database(name)
+        client.close()
+        db.client = db.database = None
+
+def main():
+    product_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    asyncio.run(run(product_count))
+
+if __name__ == "__main__":
+    main()
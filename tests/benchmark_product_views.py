@@ -0,0 +1,96 @@
+"""Benchmark of the product listing payload: ``view=card`` against ``view=full``
+
+    MONGO_URL=mongodb://localhost:27017 python tests/benchmark_product_views.py [products]   (default 100,000)
+
+Seeds a throwaway database with copies of the seed catalog (with a stock
+variant per color and size), then walks the first pages of
+``GET /api/products`` in each view the way the route does: projection pushed
+down to MongoDB, keyset cursor, JSON encoding. Prints bytes per page and time
+per page. The database is dropped afterwards.
+"""
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+import motor.motor_asyncio  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from benchmark_product_search import INSERT_BATCH_SIZE, synthetic_products  # noqa: E402
+from database import create_indexes, db  # noqa: E402
+from pagination import apply_cursor, keyset_sort, next_cursor  # noqa: E402
+from projections import PRODUCT_FIELDS, PRODUCT_VIEWS, select_fields  # noqa: E402
+
+PAGES = 50
+PAGE_SIZE = 100
+
+def with_variants(product: dict) -> dict:
+    return {
+        **product,
+        "variants": [
+            {"color": color, "size": size, "quantity": 10}
+            for color in product.get("colors", []) for size in product.get("sizes", [])
+        ]
+    }
+
+async def walk_pages(products, view: str):
+    """Bytes and seconds per page for the first PAGES pages of one view"""
+    selection = select_fields(None, view, PRODUCT_FIELDS, PRODUCT_VIEWS, internal=("createdAt", "updatedAt"))
+    projection = selection.projection()
+    sizes, times, cursor = [], [], None
+    for _ in range(PAGES):
+        started = time.perf_counter()
+        query = apply_cursor({}, cursor, "createdAt")
+        results = await products.find(query, projection).sort(keyset_sort("createdAt")).limit(PAGE_SIZE).to_list(length=PAGE_SIZE)
+        cursor = next_cursor(results, PAGE_SIZE, "createdAt")
+        for product in results:
+            product["id"] = str(product["_id"])
+            del product["_id"]
+        body = json.dumps(jsonable_encoder(selection.strip(results))).encode()
+        times.append(time.perf_counter() - started)
+        sizes.append(len(body))
+        if not cursor:
+            break
+    return sizes, times
+
+async def run(product_count: int):
+    mongo_url = os.environ.get("MONGO_URL")
+    if not mongo_url:
+        sys.exit("MONGO_URL is not set")
+    client = motor.motor_asyncio.AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=2000)
+    try:
+        await client.admin.command("ping")
+    except Exception as e:
+        client.close()
+        sys.exit(f"MongoDB unreachable: {e}")
+
+    name = f"benchmark_views_{uuid.uuid4().hex[:12]}"
+    db.client, db.database = client, client[name]
+    try:
+        products = [with_variants(product) for product in synthetic_products(product_count)]
+        for offset in range(0, len(products), INSERT_BATCH_SIZE):
+            await db.database.products.insert_many(products[offset:offset + INSERT_BATCH_SIZE])
+        await create_indexes()
+        print(f"products:    {product_count:,}, {PAGES} pages of {PAGE_SIZE} per view")
+
+        for view in ("full", "card"):
+            sizes, times = await walk_pages(db.database.products, view)
+            print(
+                f"{view + ':':<12} {statistics.mean(sizes) / 1000:.1f} kB/page, "
+                f"median {statistics.median(times) * 1000:.1f} ms, "
+                f"p95 {statistics.quantiles(times, n=20)[-1] * 1000:.1f} ms"
+            )
+    finally:
+        await client.drop_database(name)
+        client.close()
+        db.client = db.database = None
+
+def main():
+    product_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    asyncio.run(run(product_count))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Benchmark of the customer report computation on synthetic orders
+
+    python tests/benchmark_reports.py [orders]   (default 5,000,000)
+
+Only ``compute_report`` is measured (no MongoDB): wall time and the
+tracemalloc peak, next to the size of the columnar input.
+"""
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+from reports import compute_report  # noqa: E402
+
+def synthetic_data(order_count: int, seed: int = 0):
+    """One customer per ten orders, signups over 300 days, orders over 600"""
+    rng = np.random.default_rng(seed)
+    customer_count = max(order_count // 10, 1)
+    ids = np.array([ObjectId().binary for _ in range(customer_count)], dtype="S12")
+    start = np.datetime64("2025-01-01", "ms")
+    joined = start + (rng.integers(0, 300 * 86400, customer_count) * 1000).astype("timedelta64[ms]")
+    orders = {
+        "user": ids[rng.integers(0, customer_count, order_count)],
+        "created": start + (rng.integers(0, 600 * 86400, order_count) * 1000).astype("timedelta64[ms]"),
+        "total": np.round(rng.random(order_count) * 200, 2)
+    }
+    return orders, {"user": ids, "joined": joined}
+
+def main():
+    order_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    orders, users = synthetic_data(order_count)
+    input_bytes = sum(array.nbytes for array in (*orders.values(), *users.values()))
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    report = compute_report(orders, users)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"orders:      {report['orders']:,}")
+    print(f"customers:   {report['customers']:,}")
+    print(f"cohorts:     {len(report['firstOrderCohorts'])} first-order, {len(report['signupCohorts'])} signup")
+    print(f"time:        {elapsed:.2f} s")
+    print(f"peak memory: {peak / 1e6:.0f} MB (input {input_bytes / 1e6:.0f} MB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: builds or scans catalog-sized data (deselect with -m 'not slow')")
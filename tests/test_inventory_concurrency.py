@@ -0,0 +1,102 @@
+"""Concurrent orders against the variant stock counters (needs MongoDB at MONGO_URL)"""
+import asyncio
+import os
+import uuid
+import pytest
+import motor.motor_asyncio
+from bson import ObjectId
+from database import db
+from inventory import InsufficientStock, decrement_stock, restore_stock
+
+MONGO_URL = os.environ.get("MONGO_URL")
+
+pytestmark = pytest.mark.skipif(not MONGO_URL, reason="MONGO_URL is not set")
+
+def run(test):
+    """Run ``test(database)`` against a throwaway database"""
+    async def main():
+        client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL, serverSelectionTimeoutMS=2000)
+        try:
+            await client.admin.command("ping")
+        except Exception as e:
+            client.close()
+            pytest.skip(f"MongoDB unreachable: {e}")
+        name = f"test_inventory_{uuid.uuid4().hex[:12]}"
+        db.client, db.database = client, client[name]
+        try:
+            await test(db.database)
+        finally:
+            await client.drop_database(name)
+            client.close()
+            db.client = db.database = None
+    asyncio.run(main())
+
+async def insert_product(database, variants):
+    result = await database.products.insert_one({
+        "name": "Sac", "category": "sacs", "inStock": True, "variants": variants
+    })
+    return str(result.inserted_id)
+
+def line(product_id, color, size, quantity=1):
+    return {"productId": product_id, "color": color, "size": size, "quantity": quantity}
+
+async def attempt(lines):
+    try:
+        await decrement_stock(lines)
+        return True
+    except InsufficientStock:
+        return False
+
+def test_last_units_are_sold_exactly_once():
+    async def test(database):
+        product_id = await insert_product(database, [{"color": "noir", "size": "M", "quantity": 5}])
+
+        won = await asyncio.gather(*(attempt([line(product_id, "noir", "M")]) for _ in range(50)))
+
+        product = await database.products.find_one({"_id": ObjectId(product_id)})
+        assert sum(won) == 5
+        assert product["variants"][0]["quantity"] == 0
+        assert product["inStock"] is False
+    run(test)
+
+def test_rolled_back_orders_leave_counters_and_flag_consistent():
+    async def test(database):
+        # Every order takes one unit of both variants; "M" runs out first, so
+        # most orders roll their "L" unit back while others are still in flight
+        product_id = await insert_product(database, [
+            {"color": "noir", "size": "M", "quantity": 3},
+            {"color": "noir", "size": "L", "quantity": 10}
+        ])
+        order = [line(product_id, "noir", "M"), line(product_id, "noir", "L")]
+
+        won = await asyncio.gather(*(attempt(order) for _ in range(40)))
+
+        product = await database.products.find_one({"_id": ObjectId(product_id)})
+        quantities = {variant["size"]: variant["quantity"] for variant in product["variants"]}
+        # An order may also lose on "L" while rollbacks are in flight, so
+        # fewer than three can win, but never more and never half an order
+        assert sum(won) <= 3
+        assert quantities == {"M": 3 - sum(won), "L": 10 - sum(won)}
+        assert product["inStock"] is True
+    run(test)
+
+def test_flag_follows_the_last_counter_change():
+    async def test(database):
+        product_id = await insert_product(database, [{"color": "rouge", "size": "S", "quantity": 20}])
+        lines = [line(product_id, "rouge", "S")]
+
+        # Sell out and give back concurrently, many times over
+        await asyncio.gather(
+            *(attempt(lines) for _ in range(30)),
+            *(restore_stock(lines) for _ in range(10))
+        )
+
+        product = await database.products.find_one({"_id": ObjectId(product_id)})
+        quantity = product["variants"][0]["quantity"]
+        assert quantity >= 0
+        assert product["inStock"] is (quantity > 0)
+        category = await database.categories.find_one({"_id": "sacs"})
+        if category:
+            # Counter flips are reported once per real change
+            assert category.get("inStockCount", 0) == (0 if quantity > 0 else -1)
+    run(test)
@@ -0,0 +1,155 @@
+"""Relevance and latency of the in-memory product search indexes, on the seed catalog"""
+import asyncio
+import statistics
+import threading
+import time
+import pytest
+import catalog_events
+from add_bijoux_products import bijoux_products
+from fuzzy_search import TrigramIndex
+from init_data import mock_products
+from suggest import SuggestIndex
+
+def seed_catalog() -> list:
+    """Seed products (bijoux appear in both scripts) with made-up ids"""
+    by_name = {product["name"]: product for product in mock_products + bijoux_products}
+    return [{**product, "_id": f"{number:024x}"} for number, product in enumerate(by_name.values())]
+
+def large_catalog(size: int = 20000) -> list:
+    seed = seed_catalog()
+    editions = ["Luxe", "Edition", "Collection", "Classique", "Mode"]
+    return [
+        {**seed[number % len(seed)], "_id": f"{number:024x}",
+         "name": f"{seed[number % len(seed)]['name']} {editions[number % 5]} {number % 997}"}
+        for number in range(size)
+    ]
+
+@pytest.fixture(scope="module")
+def catalog():
+    products = seed_catalog()
+    fuzzy, suggest = TrigramIndex(), SuggestIndex()
+    fuzzy.rebuild(products)
+    suggest.rebuild(products)
+    names = {product["_id"]: product["name"] for product in products}
+    return fuzzy, suggest, names
+
+# Misspelled, accent-less or partial queries and the product expected first
+FUZZY_CASES = [
+    ("sac noir", "Sac à Main Élégant Noir"),
+    ("escarpin", "Escarpins Classiques Noirs"),
+    ("chaine argnt", "Chaîne Argent Élégante"),
+    ("botes pluie", "Bottes de Pluie Rigolotes"),
+    ("pendantif coeur", "Pendentif Coeur Diamant"),
+    ("colier perle", "Collier Perles et Chaîne"),
+    ("sandale enfant", "Sandales Enfant Été"),
+    ("pochete doree", "Pochette de Soirée Dorée"),
+]
+
+@pytest.mark.parametrize("query,expected", FUZZY_CASES)
+def test_fuzzy_search_ranks_the_intended_product_first(catalog, query, expected):
+    fuzzy, _, names = catalog
+    results = fuzzy.search(query)
+    assert results and names[results[0][0]] == expected
+
+def test_fuzzy_search_tolerates_typos_in_short_words(catalog):
+    fuzzy, _, names = catalog
+    top = {names[product_id] for product_id, _ in fuzzy.search("bascket")[:2]}
+    assert top == {"Baskets Enfant Colorées", "Baskets Blanches Tendance"}
+
+@pytest.mark.parametrize("prefix,expected", [
+    ("arg", "Chaîne Argent Élégante"),
+    ("ÉLÉG", "Chaîne Argent Élégante"),
+    ("sac b", "Sac Bandoulière Rose"),
+    ("bott", "Bottes de Pluie Rigolotes"),
+])
+def test_suggest_matches_any_word_prefix_without_accents(catalog, prefix, expected):
+    _, suggest, _ = catalog
+    assert expected in [entry["name"] for entry in suggest.suggest(prefix)]
+
+def test_unknown_queries_return_nothing(catalog):
+    fuzzy, suggest, _ = catalog
+    assert fuzzy.search("zzqqxx") == []
+    assert suggest.suggest("zzqq") == []
+
+def test_suggest_ranks_the_whole_prefix_range():
+    suggest = SuggestIndex()
+    products = [{"_id": f"{number:024x}", "name": f"Sac A{number:05d}", "rating": 3} for number in range(2000)]
+    suggest.rebuild(products + [{"_id": "f" * 24, "name": "Sac Zèbre", "rating": 5}])
+    assert [entry["name"] for entry in suggest.suggest("sac", 2)] == ["Sac Zèbre", "Sac A00000"]
+
+    suggest.upsert({"_id": "e" * 24, "name": "Sac Yak", "rating": 4.5})
+    suggest.remove("f" * 24)
+    assert [entry["name"] for entry in suggest.suggest("sac", 2)] == ["Sac Yak", "Sac A00000"]
+    assert [entry["name"] for entry in suggest.suggest("s", 2)] == ["Sac Yak", "Sac A00000"]
+
+def p95(samples: list) -> float:
+    return statistics.quantiles(samples, n=20)[-1]
+
+@pytest.mark.slow
+def test_latency_on_a_large_catalog():
+    suggest, fuzzy = catalog_events.build_search_indexes(large_catalog(100000))
+    assert isinstance(suggest, SuggestIndex) and isinstance(fuzzy, TrigramIndex)
+
+    fuzzy_times, suggest_times = [], []
+    for _ in range(20):
+        for query, _ in FUZZY_CASES:
+            started = time.perf_counter()
+            fuzzy.search(query)
+            fuzzy_times.append(time.perf_counter() - started)
+        for prefix in ("a", "sa", "cha", "bott", "collection"):
+            started = time.perf_counter()
+            suggest.suggest(prefix)
+            suggest_times.append(time.perf_counter() - started)
+
+    # Generous budgets at 100k products: a laptop measures a fuzzy p95 of
+    # about 13 ms and a suggest p95 well under a millisecond
+    assert p95(fuzzy_times) < 0.05
+    assert p95(suggest_times) < 0.01
+
+class FakeCursor:
+    def __init__(self, products):
+        self.products = products
+
+    async def to_list(self, length=None):
+        return self.products
+
+class FakeDatabase:
+    """Just enough of the products collection for ``load_search_indexes``"""
+
+    @property
+    def products(self):
+        return self
+
+    def find(self, query, projection):
+        return FakeCursor(seed_catalog())
+
+def test_reload_keeps_serving_and_replays_changes_made_meanwhile(monkeypatch):
+    building, release = threading.Event(), threading.Event()
+    build = catalog_events.build_search_indexes
+
+    def slow_build(products):
+        building.set()
+        release.wait(5)
+        return build(products)
+
+    async def get_database():
+        return FakeDatabase()
+
+    monkeypatch.setattr(catalog_events, "build_search_indexes", slow_build)
+    monkeypatch.setattr(catalog_events, "get_database", get_database)
+    new_product = {"_id": "f" * 24, "name": "Ceinture Cuir Camel", "category": "accessoires"}
+
+    async def scenario():
+        reload = asyncio.create_task(catalog_events.load_search_indexes())
+        while not building.is_set():
+            await asyncio.sleep(0.01)
+        # The event loop is free while the thread builds
+        catalog_events.index_product(new_product)
+        release.set()
+        await reload
+
+    asyncio.run(scenario())
+    names = [entry["name"] for entry in catalog_events.suggest_index.suggest("ceinture")]
+    assert names == ["Ceinture Cuir Camel"]
+    assert len(catalog_events.fuzzy_index) == len(seed_catalog()) + 1
+    catalog_events.unindex_product(new_product["_id"])
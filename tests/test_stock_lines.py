@@ -0,0 +1,16 @@
+"""Merging order items into stock lines"""
+from inventory import stock_lines
+
+def test_ids_in_any_case_are_one_canonical_line():
+    lines = stock_lines([
+        {"productId": "5FAAAAAAAAAAAAAAAAAAAAAA", "selectedColor": "Noir", "selectedSize": "M", "quantity": 1},
+        {"id": "5faaaaaaaaaaaaaaaaaaaaaa", "selectedColor": "Noir", "selectedSize": "M", "quantity": 2},
+    ])
+    assert lines == [{"productId": "5faaaaaaaaaaaaaaaaaaaaaa", "color": "Noir", "size": "M", "quantity": 3}]
+
+def test_variants_stay_apart():
+    lines = stock_lines([
+        {"productId": "5faaaaaaaaaaaaaaaaaaaaaa", "selectedColor": "Noir", "selectedSize": "M", "quantity": 1},
+        {"productId": "5faaaaaaaaaaaaaaaaaaaaaa", "selectedColor": "Noir", "selectedSize": "L", "quantity": 1},
+    ])
+    assert [line["size"] for line in lines] == ["M", "L"]